@@ -0,0 +1,628 @@
+import os
+import re
+import time
+import itertools
+import contextvars
+import weakref
+from typing import Callable, List, Optional
+from google.api_core import exceptions
+import google.generativeai as genai
+from dotenv import load_dotenv
+from tools import (
+    read_file, search_code, list_directory, run_command, change_directory,
+    add_to_vectorstore, search_vectorstore, index_codebase, repo_map, find_symbol, get_current_dir,
+    WorkspaceState, activate_state
+)
+from token_counter import DEFAULT_MODEL as MODEL_NAME, count_tokens
+from profiles import active_profile, context_window_for
+from context_store import shared_store, share_tool_output, make_handle, get_context, search_context
+from telemetry import span, increment
+from model_client import load_client
+
+load_dotenv()
+
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+read_file_func = genai.protos.FunctionDeclaration(
+    name="read_file",
+    description="Reads the contents of a file. The path can be relative to the current directory or absolute.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "file_path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The path to the file to read (relative or absolute)."
+            )
+        },
+        required=["file_path"]
+    )
+)
+
+search_code_func = genai.protos.FunctionDeclaration(
+    name="search_code",
+    description="Searches for a pattern in code files within a directory. The path can be relative or absolute.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "pattern": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The search pattern or text to find."
+            ),
+            "path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The directory path to search in (default: current directory)."
+            )
+        },
+        required=["pattern"]
+    )
+)
+
+list_directory_func = genai.protos.FunctionDeclaration(
+    name="list_directory",
+    description="Lists all files and directories in the specified path. The path can be relative or absolute.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The directory path to list (default: current directory)."
+            )
+        }
+    )
+)
+
+run_command_func = genai.protos.FunctionDeclaration(
+    name="run_command",
+    description="Executes a shell command from the agent's current working directory.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "command": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The shell command to execute."
+            )
+        },
+        required=["command"]
+    )
+)
+
+change_directory_func = genai.protos.FunctionDeclaration(
+    name="change_directory",
+    description="Changes the agent's current working directory. All subsequent file operations will be relative to this new directory.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The path to the new directory (relative or absolute)."
+            )
+        },
+        required=["path"]
+    )
+)
+
+search_vectorstore_func = genai.protos.FunctionDeclaration(
+    name="search_vectorstore",
+    description="Search the vector database for semantically similar code or content.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "query": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The search query to find similar content."
+            ),
+            "k": genai.protos.Schema(
+                type=genai.protos.Type.INTEGER,
+                description="Number of results to return (default depends on the model's context window)."
+            ),
+            "token_budget": genai.protos.Schema(
+                type=genai.protos.Type.INTEGER,
+                description="Maximum tokens of results to return; fills with the best matches up to this size."
+            )
+        },
+        required=["query"]
+    )
+)
+
+add_to_vectorstore_func = genai.protos.FunctionDeclaration(
+    name="add_to_vectorstore",
+    description="Add a file's content to the vector database. The path can be relative or absolute.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "file_path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The path to the file to add to the vector database."
+            )
+        },
+        required=["file_path"]
+    )
+)
+
+index_codebase_func = genai.protos.FunctionDeclaration(
+    name="index_codebase",
+    description="Index all code files in a directory for semantic search. The path can be relative or absolute.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "directory_path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The directory path to index (default: current directory)."
+            )
+        }
+    )
+)
+
+repo_map_func = genai.protos.FunctionDeclaration(
+    name="repo_map",
+    description="Get a compact skeleton of the codebase: files ranked by how much the rest of the code uses them, with classes and functions, their signatures and line numbers. Use this first to orient yourself instead of listing and reading many files.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "path": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The directory to map (default: current directory)."
+            ),
+            "depth": genai.protos.Schema(
+                type=genai.protos.Type.INTEGER,
+                description="1 = files only, 2 = top-level classes and functions (default), 3 = also methods."
+            )
+        }
+    )
+)
+
+find_symbol_func = genai.protos.FunctionDeclaration(
+    name="find_symbol",
+    description="Find where a class, function or method is defined (file and line) and which files reference it.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "name": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The symbol name, e.g. 'run_turn' or 'ContextStore.publish'."
+            )
+        },
+        required=["name"]
+    )
+)
+
+delegate_func = genai.protos.FunctionDeclaration(
+    name="delegate",
+    description="Hand a self-contained sub-task to a worker sub-agent and get its answer back. Tool outputs are shared between agents through context handles.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "task": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The sub-task for the worker, with everything it needs to know."
+            ),
+            "context_handles": genai.protos.Schema(
+                type=genai.protos.Type.ARRAY,
+                items=genai.protos.Schema(type=genai.protos.Type.STRING),
+                description="Context handles the worker should start from (optional)."
+            )
+        },
+        required=["task"]
+    )
+)
+
+get_context_func = genai.protos.FunctionDeclaration(
+    name="get_context",
+    description="Fetch the full text stored under a context handle such as 'a1b2c3d4e5f6'.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "handle": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="The context handle to fetch."
+            ),
+            "offset": genai.protos.Schema(
+                type=genai.protos.Type.INTEGER,
+                description="Character offset to start from, to continue a truncated output (default: 0)."
+            )
+        },
+        required=["handle"]
+    )
+)
+
+search_context_func = genai.protos.FunctionDeclaration(
+    name="search_context",
+    description="Search everything any agent has already read or retrieved, returning context handles.",
+    parameters=genai.protos.Schema(
+        type=genai.protos.Type.OBJECT,
+        properties={
+            "query": genai.protos.Schema(
+                type=genai.protos.Type.STRING,
+                description="What to look for."
+            ),
+            "k": genai.protos.Schema(
+                type=genai.protos.Type.INTEGER,
+                description="Number of handles to return (default: 5)."
+            )
+        },
+        required=["query"]
+    )
+)
+
+# Create tool with all function declarations
+tools = genai.protos.Tool(
+    function_declarations=[
+        read_file_func,
+        search_code_func,
+        list_directory_func,
+        run_command_func,
+        change_directory_func,
+        search_vectorstore_func,
+        add_to_vectorstore_func,
+        index_codebase_func,
+        repo_map_func,
+        find_symbol_func,
+        delegate_func,
+        get_context_func,
+        search_context_func
+    ]
+)
+
+# Gemini, or the offline scripted stand-in (AGENT_MODEL_CLIENT, see model_client.py)
+model_client = load_client([tools])
+CONTEXT_WINDOW = context_window_for(MODEL_NAME)
+# Part of the window kept free for the model's reply when tool outputs are sent back
+REPLY_RESERVE_TOKENS = max(CONTEXT_WINDOW // 8, 512)
+# Tool outputs are never cut below this, and outputs shorter than MIN_ELIDE_CHARS are never elided
+MIN_OUTPUT_TOKENS = 100
+MIN_ELIDE_CHARS = 400
+
+# Tool function mapping
+tool_functions = {
+    'read_file': read_file,
+    'search_code': search_code,
+    'list_directory': list_directory,
+    'run_command': run_command,
+    'change_directory': change_directory,
+    'search_vectorstore': search_vectorstore,
+    'add_to_vectorstore': add_to_vectorstore,
+    'index_codebase': index_codebase,
+    'repo_map': repo_map,
+    'find_symbol': find_symbol,
+    'get_context': get_context,
+    'search_context': search_context
+}
+
+# Sub-agents may not delegate further
+MAX_DELEGATION_DEPTH = 1
+_delegation_depth = contextvars.ContextVar("delegation_depth", default=0)
+_current_log = contextvars.ContextVar("current_log", default=print)
+_agent_ids = itertools.count(1)
+
+def new_agent_id(role: str) -> str:
+    return f"{role}-{next(_agent_ids)}"
+
+def delegate(task: str, context_handles: Optional[List[str]] = None) -> str:
+    """Run a sub-task on a fresh worker chat and return the worker's answer."""
+    depth = _delegation_depth.get()
+    if depth >= MAX_DELEGATION_DEPTH:
+        return "Error: Sub-agents cannot delegate further; do the task yourself."
+    token = _delegation_depth.set(depth + 1)
+    try:
+        worker_id = new_agent_id("worker")
+        message = task
+        if context_handles:
+            message += "\nShared context to start from (read with get_context): " + ", ".join(context_handles)
+        log = _current_log.get()
+        log(f"\n[Delegating to {worker_id}: {task}]")
+
+        def run_worker():
+            # The worker gets its own copy of the workspace, so its change_directory calls stay its own
+            activate_state(WorkspaceState(get_current_dir()))
+            return run_turn(new_chat(), message, log=lambda line: log(f"[{worker_id}] {line.strip()}"),
+                            agent_id=worker_id, prompt=build_worker_prompt(message))
+        try:
+            return contextvars.copy_context().run(run_worker)
+        finally:
+            # The worker's chat ends with its task
+            shared_store.forget(worker_id)
+    finally:
+        _delegation_depth.reset(token)
+
+tool_functions['delegate'] = delegate
+
+def new_chat():
+    """Start a fresh chat session on the shared model."""
+    return model_client.start_chat()
+
+def build_prompt(user_input: str) -> str:
+    return f"""You are an expert coding assistant for professional development environments.
+Analyze the codebase and provide help with the user's coding task: {user_input}.
+Use available tools to read files, search code, list directories, and run commands.
+Provide detailed analysis, suggestions for optimization, and specific code changes if needed.
+"""
+
+def build_worker_prompt(task: str) -> str:
+    return f"""You are a worker sub-agent helping a planner agent with one sub-task: {task}
+Use the available tools. Outputs are tagged with [context <handle>]; cite handles instead of
+pasting large file contents into your answer. Reply with a concise, self-contained result.
+"""
+
+def cap_output(output: str, handle: str, start: int = 0, limit: Optional[int] = None) -> str:
+    """Trim a tool output to the profile's limit, pointing at the rest in the context store.
+
+    `output` is a header line followed by the stored content from character `start`.
+    """
+    limit = limit or active_profile.tool_output_tokens
+    tokens = count_tokens(output)
+    if tokens <= limit:
+        return output
+    header, _, body = output.partition("\n")
+    keep = int(len(body) * limit / tokens * 0.9)
+    return (f"{header}\n{body[:keep]}\n[Output truncated to fit the context window; "
+            f"continue with get_context('{handle}', offset={start + keep})]")
+
+def execute_tool(agent_id: str, function_name: str, function_args: dict) -> str:
+    """Run a tool call, serving identical read-only calls from the shared context store."""
+    traced_args = {k: str(v)[:200] for k, v in function_args.items()}
+    with span(f"tool.{function_name}", agent=agent_id, args=traced_args) as tool_span:
+        output = _execute_tool(agent_id, function_name, function_args, tool_span)
+        tool_span.set(output_chars=len(output))
+        if output.startswith("Error"):
+            tool_span.set(error=output[:200])
+        return output
+
+def _execute_tool(agent_id: str, function_name: str, function_args: dict, tool_span) -> str:
+    cwd = get_current_dir()
+    result = shared_store.cached_result(function_name, function_args, cwd)
+    tool_span.set(cache_hit=result is not None)
+    increment("tool_cache_hits" if result is not None else "tool_cache_misses")
+    if result is None:
+        try:
+            if function_name in tool_functions:
+                result = str(tool_functions[function_name](**function_args))
+            else:
+                return f"Error: Unknown function {function_name}"
+        except Exception as e:
+            return f"Error executing {function_name}: {str(e)}"
+    if function_name in ('get_context', 'search_context') or result.startswith("Error"):
+        shared_store.record_result(function_name, function_args, cwd, None)
+        if function_name == 'get_context' and not result.startswith("Error"):
+            return cap_output(result, str(function_args['handle']).strip(), int(function_args.get('offset', 0)))
+        return result
+    shared = share_tool_output(agent_id, function_name, function_args, result)
+    handle = make_handle(result)
+    shared_store.record_result(function_name, function_args, cwd, handle)
+    return cap_output(shared, handle)
+
+# Prompt tokens of each chat's latest request, as reported by the API
+_prompt_tokens = weakref.WeakKeyDictionary()
+
+def _content_text(content) -> str:
+    texts = []
+    for part in content.parts:
+        if part.text:
+            texts.append(part.text)
+        elif part.function_call.name:
+            texts.append(f"[called {part.function_call.name}({dict(part.function_call.args)})]")
+        elif part.function_response.name:
+            texts.append(f"[{part.function_response.name} returned: {dict(part.function_response.response)}]")
+    return "\n".join(texts)
+
+def _turn_starts(history) -> List[int]:
+    return [i for i, content in enumerate(history)
+            if content.role == "user" and any(part.text for part in content.parts)]
+
+def compact_history(chat, log: Callable[[str], None] = print, mid_turn: bool = False,
+                    keep_tokens: Optional[int] = None):
+    """Replace older turns with a summary, keeping recent turns up to `keep_tokens`.
+
+    `keep_tokens` defaults to the profile's history budget. With `mid_turn`, the
+    turn in progress is always kept whole: its function calls still wait for
+    their responses.
+    """
+    if keep_tokens is None:
+        keep_tokens = active_profile.history_tokens
+    history = list(chat.history)
+    # Only cut where a user message starts a turn, so function calls stay paired with their responses
+    turn_starts = _turn_starts(history)
+    keep_from, kept_tokens = len(history), 0
+    if mid_turn and turn_starts:
+        keep_from = turn_starts.pop()
+        kept_tokens = sum(count_tokens(_content_text(c)) for c in history[keep_from:])
+    for start in reversed(turn_starts):
+        kept_tokens += sum(count_tokens(_content_text(c)) for c in history[start:keep_from])
+        if kept_tokens > keep_tokens:
+            break
+        keep_from = start
+    if keep_from == 0:
+        return
+
+    transcript = "\n".join(f"{content.role}: {_content_text(content)}" for content in history[:keep_from])
+    try:
+        with span("model.summarize", messages=keep_from):
+            summary = model_client.generate_content(
+                "Summarize this conversation between a user and a coding assistant. Keep the user's goals, "
+                "decisions made, file paths, context handles and open questions; drop tool output details.\n\n"
+                + transcript
+            ).text
+    except Exception as e:
+        # Dropping the old turns still keeps the next request inside the context window
+        log(f"\n[Could not summarize history ({e}); dropping older turns]")
+        summary = "(earlier turns were dropped)"
+    chat.history = [
+        genai.protos.Content(role="user", parts=[genai.protos.Part(text=f"Summary of the conversation so far:\n{summary}")]),
+        genai.protos.Content(role="model", parts=[genai.protos.Part(text="Understood.")]),
+    ] + history[keep_from:]
+    log(f"\n[Summarized {keep_from} earlier messages to stay within the {active_profile.name} profile]")
+
+def _record_usage(chat, response, totals: dict):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    _prompt_tokens[chat] = usage.prompt_token_count
+    totals["prompt"] = usage.prompt_token_count
+    totals["last_output"] = usage.candidates_token_count
+    totals["output"] += usage.candidates_token_count
+    increment("tokens_in", usage.prompt_token_count)
+    increment("tokens_out", usage.candidates_token_count)
+
+def _send(chat, content, agent_id: str):
+    """Send a message or function responses to the model as a timed span."""
+    with span("model.generate", agent=agent_id) as model_span:
+        response = chat.send_message(content)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            model_span.set(prompt_tokens=usage.prompt_token_count, output_tokens=usage.candidates_token_count)
+        return response
+
+# One planner id per chat, so outputs it already saw in earlier turns are deduplicated
+_planner_ids = weakref.WeakKeyDictionary()
+
+def _planner_id(chat) -> str:
+    agent_id = _planner_ids.get(chat)
+    if agent_id is None:
+        agent_id = _planner_ids[chat] = new_agent_id("planner")
+        weakref.finalize(chat, shared_store.forget, agent_id)
+    return agent_id
+
+def _history_tokens(chat) -> int:
+    return sum(count_tokens(_content_text(content)) for content in chat.history)
+
+def _elide_turn_outputs(chat) -> bool:
+    """Swap the current turn's earlier tool outputs for their context handles; True if any changed."""
+    history = list(chat.history)
+    starts = _turn_starts(history)
+    changed = False
+    for i in range(starts[-1] if starts else 0, len(history)):
+        parts = []
+        for part in history[i].parts:
+            result = str(dict(part.function_response.response).get("result", "")) if part.function_response.name else ""
+            match = re.match(r"\[context (\w+)", result)
+            if match and len(result) > MIN_ELIDE_CHARS:
+                handle = match.group(1)
+                part = genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                    name=part.function_response.name,
+                    response={"result": f"[context {handle}] Output removed to fit the context window; "
+                                        f"call get_context('{handle}') if you still need it."}))
+                changed = True
+            parts.append(part)
+        history[i] = genai.protos.Content(role=history[i].role, parts=parts)
+    if changed:
+        chat.history = history
+    return changed
+
+def _shrink_output(result: str, limit: int) -> str:
+    if count_tokens(result) <= limit:
+        return result
+    header = result.partition("\n")[0]
+    match = re.match(r"\[context (\w+)(?:.*from character (\d+))?", header)
+    if match:
+        return cap_output(result, match.group(1), int(match.group(2) or 0), limit=limit)
+    keep = int(len(result) * limit / count_tokens(result) * 0.9)
+    return result[:keep] + "\n[Output truncated to fit the context window]"
+
+def _fit_to_window(chat, results: List[tuple], totals: dict, log: Callable[[str], None]) -> List[tuple]:
+    """Make room for a batch of (name, output) tool results before they are sent.
+
+    The next prompt is the last one plus the model's reply plus these outputs.
+    If that would overflow the window, older turns are summarized first, then
+    this turn's earlier outputs are replaced by context handles, and finally
+    the new outputs are cut down to share what is left.
+    """
+    limit = CONTEXT_WINDOW - REPLY_RESERVE_TOKENS
+    new_tokens = sum(count_tokens(result) for _, result in results)
+    current = totals["prompt"] + totals["last_output"] or _history_tokens(chat)
+    if current + new_tokens <= limit:
+        return results
+    # Tool declarations and other parts of the prompt that are not in the history
+    overhead = max(current - _history_tokens(chat), 0)
+
+    def needed() -> int:
+        return overhead + _history_tokens(chat) + new_tokens
+    log(f"\n[Tool outputs would overflow the {CONTEXT_WINDOW}-token window; making room]")
+    increment("context_overflows_avoided")
+    # Older turns are kept only as far as they still fit next to the new outputs
+    compact_history(chat, log, mid_turn=True,
+                    keep_tokens=min(active_profile.history_tokens, limit - overhead - new_tokens))
+    if needed() > limit:
+        _elide_turn_outputs(chat)
+    available = limit - overhead - _history_tokens(chat)
+    if sum(count_tokens(result) for _, result in results) > available:
+        share = max(available // max(len(results), 1), MIN_OUTPUT_TOKENS)
+        results = [(name, _shrink_output(result, share)) for name, result in results]
+    return results
+
+def run_turn(chat, user_input: str, log: Callable[[str], None] = print,
+             agent_id: Optional[str] = None, prompt: Optional[str] = None) -> str:
+    """Send one user request through the chat, executing tool calls until the model answers."""
+    agent_id = agent_id or _planner_id(chat)
+    prompt = prompt or build_prompt(user_input)
+    log_token = _current_log.set(log)
+    try:
+        with span("agent.turn", agent=agent_id), shared_store.turn():
+            return _run_turn(chat, prompt, log, agent_id)
+    finally:
+        _current_log.reset(log_token)
+
+def _run_turn(chat, prompt: str, log: Callable[[str], None], agent_id: str) -> str:
+    if _prompt_tokens.get(chat, 0) > active_profile.summarize_at_tokens:
+        compact_history(chat, log)
+
+    # Send message with retry logic
+    response = None
+    for _ in range(3):  # Retry up to 3 times
+        try:
+            response = _send(chat, prompt, agent_id)
+            break  # Success
+        except exceptions.ResourceExhausted:
+            increment("model_rate_limited")
+            log("\n[Rate limit exceeded, retrying in 5 seconds...]")
+            time.sleep(5)
+
+    if not response:
+        return "[Failed to get response from API after multiple retries.]"
+
+    totals = {"prompt": 0, "output": 0, "last_output": 0}
+    _record_usage(chat, response, totals)
+
+    # Maximum iterations to prevent infinite loops
+    max_iterations = active_profile.max_iterations
+    iteration = 0
+
+    while iteration < max_iterations:
+        # Check if response contains function calls
+        parts = response.candidates[0].content.parts
+        function_calls = [part for part in parts if part.function_call.name]
+
+        if not function_calls:
+            # No more function calls, return final response
+            log(f"\n[Tokens: {totals['prompt']} prompt + {totals['output']} output this turn, "
+                f"window {CONTEXT_WINDOW} ({active_profile.name} profile)]")
+            return response.text
+
+        # Execute each function call
+        results = []
+        for part in function_calls:
+            function_call = part.function_call
+            function_name = function_call.name
+            function_args = dict(function_call.args)
+
+            log(f"\n[Calling tool: {function_name} with args: {function_args}]")
+
+            # Execute the function through the shared context store
+            results.append((function_name, str(execute_tool(agent_id, function_name, function_args))))
+
+        # Several rounds of tool outputs can overflow the window within one turn
+        results = _fit_to_window(chat, results, totals, log)
+        function_responses = [
+            genai.protos.Part(
+                function_response=genai.protos.FunctionResponse(
+                    name=function_name,
+                    response={"result": result}
+                )
+            )
+            for function_name, result in results
+        ]
+
+        # Send function responses back to the model
+        response = _send(chat, function_responses, agent_id)
+        _record_usage(chat, response, totals)
+        iteration += 1
+
+    return "[Warning: Maximum function call iterations reached]"
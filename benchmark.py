@@ -0,0 +1,310 @@
+"""Reproducible benchmarks for indexing, retrieval and late chunking.
+
+Builds a fixed synthetic corpus (seeded Python, JavaScript and Markdown files)
+plus the bundled test_resources PDF in a temporary directory and measures:
+
+    startup_seconds            fresh process: import tools, load the model, open the store
+    index_files_per_second     index_codebase over the corpus
+    index_chunks_per_second
+    search_p50_ms / p95_ms     search_vectorstore latency over a fixed query set
+    late_chunking_tokens_per_second
+    peak_rss_mb                peak resident memory of the benchmark process
+    compact_recall_at_10       with VECTOR_STORE=compact, recall against exact float32 search
+
+Everything runs offline (HF_HUB_OFFLINE=1), so the embedding model must already
+be in the local cache. `--embedding hashing` swaps it for a small hashing
+embedding to measure everything except model inference.
+
+    python benchmark.py --output results.json
+    python benchmark.py --embedding hashing               # compare with benchmark_baseline.json, exit 1 on regressions
+    python benchmark.py --save-baseline                   # record benchmark_baseline.json
+    python benchmark.py --baseline other_results.json     # compare with another run
+
+The committed benchmark_baseline.json was recorded with `--embedding hashing`,
+so it does not depend on the model. A run whose settings (embedding, store,
+corpus, queries) differ from the baseline's is not compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_PDF = os.path.join(HERE, "test_resources", "2509.19341v1.pdf")
+DEFAULT_BASELINE = os.path.join(HERE, "benchmark_baseline.json")
+
+# Metric -> whether larger values are better
+METRICS = {
+    "startup_seconds": False,
+    "index_files_per_second": True,
+    "index_chunks_per_second": True,
+    "search_p50_ms": False,
+    "search_p95_ms": False,
+    "late_chunking_tokens_per_second": True,
+    "peak_rss_mb": False,
+    "compact_recall_at_10": True,
+}
+
+_WORDS = ("parse", "load", "config", "retry", "request", "cache", "token", "index", "render", "template",
+          "session", "user", "query", "vector", "chunk", "stream", "page", "model", "batch", "queue")
+
+
+def _name(rng: random.Random, parts: int = 2) -> str:
+    return "_".join(rng.choice(_WORDS) for _ in range(parts))
+
+
+def _python_file(rng: random.Random) -> str:
+    lines = ['"""Synthetic module for benchmarking."""', "import os", ""]
+    for _ in range(rng.randint(2, 4)):
+        cls = "".join(w.title() for w in _name(rng).split("_"))
+        lines += [f"class {cls}:", f'    """Handles {_name(rng, 3).replace("_", " ")}."""', ""]
+        for _ in range(rng.randint(2, 5)):
+            method = _name(rng)
+            lines += [f"    def {method}(self, {_name(rng, 1)}, {_name(rng, 1)}_count=3):",
+                      f'        """Return the {_name(rng, 2).replace("_", " ")} for the given input."""']
+            for _ in range(rng.randint(3, 12)):
+                lines.append(f"        {_name(rng)} = os.path.join(str({_name(rng, 1)}_count), '{_name(rng, 1)}')")
+            lines += [f"        return {_name(rng, 1)}_count", ""]
+    for _ in range(rng.randint(1, 3)):
+        lines += [f"def {_name(rng, 3)}(path):", f"    return {_name(rng)}(path) if path else None", ""]
+    return "\n".join(lines)
+
+
+def _javascript_file(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(3, 8)):
+        lines += [f"function {_name(rng).replace('_', '')}(input, options) {{",
+                  *[f"  const {_name(rng, 1)}{i} = input.{_name(rng, 1)} || options.{_name(rng, 1)};" for i in range(rng.randint(2, 8))],
+                  "  return input;", "}", ""]
+    return "\n".join(lines)
+
+
+def _markdown_file(rng: random.Random) -> str:
+    lines = [f"# {_name(rng, 3).replace('_', ' ').title()}", ""]
+    for _ in range(rng.randint(3, 6)):
+        lines += [f"## {_name(rng, 2).replace('_', ' ').title()}", ""]
+        for _ in range(rng.randint(2, 4)):
+            sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 20)))
+            lines += [f"The {sentence.capitalize()}. It is used to {_name(rng, 3).replace('_', ' ')}.", ""]
+    return "\n".join(lines)
+
+
+def build_corpus(directory: str, files: int = 200, seed: int = 0, include_pdf: bool = True) -> dict:
+    """Write the synthetic corpus; the same seed always gives the same files."""
+    rng = random.Random(seed)
+    generators = [(".py", _python_file, 0.6), (".js", _javascript_file, 0.2), (".md", _markdown_file, 0.2)]
+    total_bytes = 0
+    for i in range(files):
+        package = os.path.join(directory, f"pkg{i % 10}")
+        os.makedirs(package, exist_ok=True)
+        extension, generate, _ = rng.choices(generators, weights=[g[2] for g in generators])[0]
+        content = generate(rng)
+        with open(os.path.join(package, f"module_{i}{extension}"), "w") as f:
+            f.write(content)
+        total_bytes += len(content)
+    pdf = include_pdf and os.path.exists(TEST_PDF)
+    if pdf:
+        shutil.copy(TEST_PDF, os.path.join(directory, os.path.basename(TEST_PDF)))
+        total_bytes += os.path.getsize(TEST_PDF)
+    return {"files": files + int(pdf), "bytes": total_bytes, "seed": seed, "pdf": pdf}
+
+
+def build_queries(count: int = 50, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    templates = ["where is {} handled", "function that does {}", "how do we {}", "{} implementation"]
+    return [rng.choice(templates).format(_name(rng, 2).replace("_", " ")) for _ in range(count)]
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _configure(store_dir: str, embedding: str):
+    """Point tools at a scratch store and the requested embedding before first use."""
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ["WATCH_INDEX"] = "0"
+    os.environ["VECTOR_STORE_PATH"] = os.path.join(store_dir, "store")
+    import tools
+    tools.CHROMA_PATH = os.path.join(store_dir, "chroma")
+    tools.VECTOR_STORE_PATH = os.environ["VECTOR_STORE_PATH"]
+    if embedding == "hashing":
+        from tets_script import HashingEmbeddingFunction
+        tools._embedding_function = HashingEmbeddingFunction()
+    return tools
+
+
+def measure_startup(embedding: str) -> float:
+    """Seconds for a fresh interpreter to import tools, load the model and open the store."""
+    with tempfile.TemporaryDirectory() as store_dir:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, __file__, "--startup-probe", store_dir, "--embedding", embedding],
+                       check=True, cwd=HERE, capture_output=True)
+        return time.perf_counter() - start
+
+
+def measure_late_chunking(texts: list) -> float:
+    from embedding_backends import get_backend
+    from late_chunking_utils import get_late_chunking_embeddings
+    tokenizer = get_backend().tokenizer
+    get_late_chunking_embeddings(texts[0])  # warm up
+    tokens = 0
+    start = time.perf_counter()
+    for text in texts:
+        get_late_chunking_embeddings(text)
+        tokens += len(tokenizer(text)["input_ids"])
+    return tokens / (time.perf_counter() - start)
+
+
+def run(files: int = 200, queries: int = 50, seed: int = 0, embedding: str = "backend") -> dict:
+    startup = measure_startup(embedding)
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        corpus = build_corpus(corpus_dir, files=files, seed=seed)
+        tools = _configure(workdir, embedding)
+        tools.warm_up()
+
+        start = time.perf_counter()
+        summary = tools.index_codebase(corpus_dir)
+        index_seconds = time.perf_counter() - start
+        if summary.startswith("Error"):
+            raise RuntimeError(summary)
+        chunks = tools._get_store().count()
+
+        query_set = build_queries(queries, seed=seed + 1)
+        tools.search_vectorstore(query_set[0])  # warm up
+        latencies = []
+        for query in query_set:
+            start = time.perf_counter()
+            tools.search_vectorstore(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        late_chunking = None
+        if embedding == "backend":
+            markdown = []
+            for root, _, names in os.walk(corpus_dir):
+                markdown += [os.path.join(root, n) for n in sorted(names) if n.endswith(".md")]
+            texts = [open(path).read() for path in sorted(markdown)[:20]]
+            late_chunking = measure_late_chunking(texts) if texts else None
+
+        compact_recall = None
+        if tools.VECTOR_STORE == "compact":
+            compact_recall = tools._get_store().recall_benchmark(k=10)["recall"]
+
+        metrics = {
+            "startup_seconds": startup,
+            "index_files_per_second": corpus["files"] / index_seconds,
+            "index_chunks_per_second": chunks / index_seconds,
+            "search_p50_ms": statistics.median(latencies),
+            "search_p95_ms": _percentile(latencies, 0.95),
+            "late_chunking_tokens_per_second": late_chunking,
+            "peak_rss_mb": _peak_rss_mb(),
+            "compact_recall_at_10": compact_recall,
+        }
+        return {
+            "meta": {
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "embedding": tools.EMBEDDING_BACKEND if embedding == "backend" else embedding,
+                "vector_store": tools.VECTOR_STORE,
+                "corpus": corpus,
+                "chunks": chunks,
+                "queries": len(query_set),
+            },
+            "metrics": metrics,
+        }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.10) -> list:
+    """Return (metric, baseline, current, change, regressed) rows for metrics present in both."""
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        old, new = baseline["metrics"].get(metric), results["metrics"].get(metric)
+        if old is None or new is None or old == 0:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((metric, old, new, change, regressed))
+    return rows
+
+
+def _mismatch(results: dict, baseline: dict) -> list:
+    """Settings that differ between two runs, which makes their metrics incomparable."""
+    return [key for key in ("embedding", "vector_store", "corpus", "queries")
+            if results["meta"].get(key) != baseline["meta"].get(key)]
+
+
+def _startup_probe(store_dir: str, embedding: str):
+    tools = _configure(store_dir, embedding)
+    tools.warm_up()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexing, retrieval and late chunking.")
+    parser.add_argument("--files", type=int, default=200, help="synthetic source files in the corpus")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding", choices=("backend", "hashing"), default="backend",
+                        help="'backend' uses EMBEDDING_BACKEND; 'hashing' leaves out model inference")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) else None,
+                        help="compare against a results file (default: benchmark_baseline.json); exit 1 on regressions")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="store results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative change before a regression")
+    parser.add_argument("--startup-probe", metavar="STORE_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        _startup_probe(args.startup_probe, args.embedding)
+        return
+
+    baseline = None
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(files=args.files, queries=args.queries, seed=args.seed, embedding=args.embedding)
+    print(json.dumps(results, indent=2))
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        mismatch = _mismatch(results, baseline)
+        if mismatch:
+            print(f"\nNot compared with baseline {args.baseline}: different {', '.join(mismatch)}")
+            return
+        rows = compare(results, baseline, args.tolerance)
+        print(f"\nAgainst baseline {baseline['meta'].get('commit')} (tolerance {args.tolerance:.0%}):")
+        for metric, old, new, change, regressed in rows:
+            print(f"  {metric:34} {old:12.3f} -> {new:12.3f}  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
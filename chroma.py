@@ -67,75 +67,22 @@
 #     print(f"Query failed: {e}")
 
  
-# FUCK IT WE BALL
-import chromadb
+# Index the notes through tools.py, so they share its versioned store
+# (./chroma_db, collection codebase-<version>) and embedding model instead of
+# keeping a second, incompatible collection in ./chroma_db_data.
 import os
-from chromadb.utils import embedding_functions
-from transformers import AutoModel, AutoConfig
 
-# 1. Initialize Persistent Client
-chroma_client = chromadb.PersistentClient(path="./chroma_db_data")
+import tools
 
-# 2. MANUALLY LOAD JINA CONFIGURATION
-# This bypasses the automatic mismatch by loading the config explicitly first.
-model_name = "jinaai/jina-embeddings-v2-base-en"
-
-# Load the config with trust_remote_code=True so we get the real JinaBertConfig
-config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
-
-# Define a custom embedding function that uses this specific config logic
-# We will use the standard loader but pass the pre-loaded config class name if needed,
-# OR simply use the 'sentence_transformers' wrapper with specific kwargs that force the match.
-# However, the cleanest way now is to use the library's explicit `modules` API if the high-level API fails.
-
-# SIMPLIFIED FIX:
-# We will try to let sentence-transformers handle it by explicitly NOT passing a conflicting config.
-# If that fails, we fall back to a generic "default" embedding function for now to get you unblocked.
-
-# Let's try the specific fix for the Config Mismatch:
-jina_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name=model_name,
-    model_kwargs={
-        "trust_remote_code": True, 
-        # This creates a fresh config from the remote code instead of forcing a cached standard one
-        "config": config 
-    }
-)
-
-collection = chroma_client.get_or_create_collection(
-    name="my_collection",
-    embedding_function=jina_ef
-)
-
-# ... [Rest of your file reading code] ...
 docs_dir = os.path.expanduser("~/sem_notes/")
-documents = []
-ids = []
 
 print(f"Checking directory: {docs_dir}")
 if os.path.exists(docs_dir):
-    for filename in os.listdir(docs_dir):
+    for filename in sorted(os.listdir(docs_dir)):
         if filename.endswith(".txt"):
-            filepath = os.path.join(docs_dir, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if content.strip():
-                        documents.append(content)
-                        ids.append(filename)
-            except Exception as e:
-                print(f"Skipping {filename}: {e}")
-
-    if documents:
-        print(f"Upserting {len(documents)} documents...")
-        collection.upsert(documents=documents, ids=ids)
-        print("Upsert complete.")
-    else:
-        print("No valid documents found.")
+            print(tools.add_to_vectorstore(os.path.join(docs_dir, filename)))
+else:
+    print(f"Directory {docs_dir} not found")
 
 # Query
-results = collection.query(
-    query_texts=["negative cry sad depressed"],
-    n_results=2
-)
-print(results)
+print(tools.search_vectorstore("negative cry sad depressed", k=2))
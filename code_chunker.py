@@ -0,0 +1,223 @@
+"""Language-aware chunking for index_codebase.
+
+Files are cut at syntactic units instead of every N characters:
+
+    .py                       top-level statements, classes and functions via `ast`
+    .js .ts .java .c .cpp .h  brace-balanced blocks at the shallowest level
+    .md                       heading sections
+    anything else             blank-line separated paragraphs
+
+Small sibling units are merged until the token budget is reached, and units
+that are still too large are split into their children (methods of a class,
+statements of a function) or, as a last resort, at line boundaries. Chunks
+never overlap. Each chunk records the symbols it covers (pieces of a split unit keep the
+unit's name) and its line range.
+"""
+import ast
+import re
+from typing import Callable, List, Optional
+
+DEFAULT_CHUNK_TOKENS = 512
+# Part of the index version tag; bump whenever chunk boundaries or metadata change so indexes get rebuilt
+CHUNKER_VERSION = 2
+
+BRACE_EXTENSIONS = {'.js', '.ts', '.java', '.c', '.cpp', '.h'}
+
+# First identifier after a declaration keyword, or a function/method name before "("
+_DECLARATION = re.compile(
+    r'\b(?:class|interface|enum|struct|function|def|namespace|type)\s+([A-Za-z_$][\w$]*)'
+    r'|([A-Za-z_$][\w$]*)\s*(?:=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>)|\([^;{]*\)\s*(?:const\s*)?(?:throws [\w., ]+)?\s*\{)'
+)
+_CONTROL_WORDS = {'if', 'for', 'while', 'switch', 'catch', 'return', 'else', 'do', 'try', 'new'}
+
+
+def approximate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for code and prose)."""
+    return len(text) // 4 + 1
+
+
+class Unit:
+    """A span of lines [start, end) (0-based) that should stay together if it fits."""
+
+    def __init__(self, start: int, end: int, symbol: str = "", children: Optional[List["Unit"]] = None):
+        self.start = start
+        self.end = end
+        self.symbol = symbol
+        self.children = children or []
+
+
+def _cover(units: List[Unit], start: int, end: int) -> List[Unit]:
+    """Stretch units so that together they cover [start, end) without gaps.
+
+    Text between two units (comments, blank lines) is attached to the following
+    unit, trailing text to the last one.
+    """
+    units = [u for u in sorted(units, key=lambda u: u.start) if u.end > start and u.start < end]
+    if not units:
+        return [Unit(start, end)]
+    units[0].start = start
+    for prev, unit in zip(units, units[1:]):
+        prev.end = unit.start
+    units[-1].end = end
+    for unit in units:
+        if unit.children:
+            unit.children = _cover(unit.children, unit.start, unit.end)
+    return units
+
+
+def _python_units(source: str, lines: List[str]) -> List[Unit]:
+    tree = ast.parse(source)
+
+    def unit_for(node, prefix: str) -> Unit:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+        end = node.end_lineno
+        symbol = ""
+        children = []
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            symbol = prefix + node.name
+            body = [unit_for(child, symbol + ".") for child in node.body]
+            # The header (signature, docstring) stays with the first child
+            children = _cover(body, start, end) if body else []
+        return Unit(start, end, symbol, children)
+
+    return [unit_for(node, "") for node in tree.body]
+
+
+def _brace_units(lines: List[str], start: int, end: int) -> List[Unit]:
+    """Split lines into blocks that start and end at the same brace depth."""
+    units = []
+    depth = 0
+    unit_start = None
+    for i in range(start, end):
+        # Drop string literals and line comments before counting braces
+        code = re.sub(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`|//.*', '', lines[i])
+        if unit_start is None and code.strip():
+            unit_start = i
+        depth += code.count('{') - code.count('}')
+        if unit_start is not None and depth <= 0 and (code.rstrip().endswith(('}', ';', '};')) or not code.strip()):
+            depth = 0
+            units.append(_brace_unit(lines, unit_start, i + 1))
+            unit_start = None
+    if unit_start is not None:
+        units.append(_brace_unit(lines, unit_start, end))
+    return units
+
+
+def _brace_unit(lines: List[str], start: int, end: int) -> Unit:
+    symbol = ""
+    for line in lines[start:min(end, start + 3)]:
+        for match in _DECLARATION.finditer(line):
+            name = match.group(1) or match.group(2)
+            if name and name not in _CONTROL_WORDS:
+                symbol = name
+                break
+        if symbol:
+            break
+    children = []
+    if end - start > 2:
+        # Members of a class/namespace body, found one level deeper
+        inner = _brace_units(lines, start + 1, end - 1)
+        if len(inner) > 1:
+            children = _cover(inner, start, end)
+            if symbol:
+                for child in children:
+                    if child.symbol:
+                        child.symbol = f"{symbol}.{child.symbol}"
+    return Unit(start, end, symbol, children)
+
+
+def _markdown_units(lines: List[str]) -> List[Unit]:
+    headings = [i for i, line in enumerate(lines) if re.match(r'#{1,6}\s', line)]
+    return [Unit(i, i + 1, lines[i].lstrip('#').strip()) for i in headings]
+
+
+def _paragraph_units(lines: List[str]) -> List[Unit]:
+    units = []
+    for i, line in enumerate(lines):
+        if line.strip() and (i == 0 or not lines[i - 1].strip()):
+            units.append(Unit(i, i + 1))
+    return units
+
+
+def _units_for(path: str, source: str, lines: List[str]) -> List[Unit]:
+    ext = path[path.rfind('.'):].lower() if '.' in path else ''
+    if ext == '.py':
+        try:
+            return _python_units(source, lines)
+        except (SyntaxError, ValueError):
+            pass  # Not valid Python; fall back to paragraphs
+    elif ext in BRACE_EXTENSIONS:
+        return _brace_units(lines, 0, len(lines))
+    elif ext == '.md':
+        return _markdown_units(lines)
+    return _paragraph_units(lines)
+
+
+def chunk_code(source: str, path: str, max_tokens: int = DEFAULT_CHUNK_TOKENS,
+               count_tokens: Callable[[str], int] = approximate_tokens) -> List[dict]:
+    """Split a file into chunks of whole syntactic units.
+
+    Returns dicts with `text`, `symbol` (comma separated names of the
+    definitions in the chunk, may be empty), `start_line` and `end_line`
+    (1-based, inclusive).
+    """
+    lines = source.splitlines(keepends=True)
+    if not lines:
+        return []
+
+    def text_of(start: int, end: int) -> str:
+        return "".join(lines[start:end])
+
+    def fit(units: List[Unit]) -> List[Unit]:
+        """Replace units over the budget by their children, or by line-bounded pieces."""
+        fitted = []
+        for unit in units:
+            if count_tokens(text_of(unit.start, unit.end)) <= max_tokens:
+                fitted.append(unit)
+            elif unit.children:
+                # Statements split out of a large function still belong to it
+                for child in unit.children:
+                    child.symbol = child.symbol or unit.symbol
+                fitted.extend(fit(unit.children))
+            else:
+                fitted.extend(split_lines(unit))
+        return fitted
+
+    def split_lines(unit: Unit) -> List[Unit]:
+        pieces, start, size = [], unit.start, 0
+        for i in range(unit.start, unit.end):
+            line_tokens = count_tokens(lines[i])
+            if size and size + line_tokens > max_tokens:
+                pieces.append(Unit(start, i, unit.symbol))
+                start, size = i, 0
+            size += line_tokens
+        pieces.append(Unit(start, unit.end, unit.symbol))
+        return pieces
+
+    chunks = []
+    current: List[Unit] = []
+    current_tokens = 0
+
+    def flush():
+        if current:
+            start, end = current[0].start, current[-1].end
+            symbols = [u.symbol for u in current if u.symbol]
+            text = text_of(start, end)
+            if text.strip():
+                chunks.append({
+                    "text": text,
+                    "symbol": ", ".join(dict.fromkeys(symbols)),
+                    "start_line": start + 1,
+                    "end_line": end,
+                })
+
+    # Greedily merge neighbouring units up to the budget
+    for unit in fit(_cover(_units_for(path, source, lines), 0, len(lines))):
+        tokens = count_tokens(text_of(unit.start, unit.end))
+        if current and current_tokens + tokens > max_tokens:
+            flush()
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+    flush()
+    return chunks
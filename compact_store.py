@@ -0,0 +1,200 @@
+"""Compact on-disk vector store with int8 codes and exact float32 re-ranking.
+
+Only the quantized codes (one int8 per kept dimension plus one float32 scale
+per vector) are held in RAM. Full float32 vectors stay in the memory-mapped
+file of NumpyVectorStore, so re-ranking the top candidates reads just those
+rows. Optionally the codes keep only the first `truncate_dim` dimensions
+(Matryoshka-style), which shrinks the in-RAM index further.
+
+Files under `path`, in addition to the NumpyVectorStore layout:
+    codes.i8        int8 codes of the (truncated) vectors
+    scales.f32      per-vector dequantization scale
+"""
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+from vectorstore import NumpyVectorStore, SCAN_BLOCK_ROWS, _normalize
+
+# Rows the recall check compares against; exact search over all of them is the expensive part
+RECALL_SAMPLE_ROWS = 20000
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetric per-vector int8 quantization; returns (codes, scales)."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class CompactVectorStore(NumpyVectorStore):
+    """Cosine-similarity store searched on int8 codes and re-ranked on float32 vectors."""
+
+    def __init__(self, path: str, embedding_function, truncate_dim: Optional[int] = None, rerank_factor: int = 4):
+        self._truncate_dim = truncate_dim
+        self.rerank_factor = max(1, rerank_factor)
+        super().__init__(path, embedding_function)
+
+    def _default_config(self) -> dict:
+        return {"truncate_dim": self._truncate_dim, "quantization": "int8"}
+
+    @property
+    def code_dim(self) -> Optional[int]:
+        if self.dim is None:
+            return None
+        return min(self.config["truncate_dim"] or self.dim, self.dim)
+
+    def _row_files(self) -> List[tuple]:
+        return super()._row_files() + [("codes.i8", self.code_dim or 0), ("scales.f32", 4)]
+
+    def _load(self):
+        super()._load()
+        # The IVF lists are not used; the int8 scan replaces them
+        self._centroids = None
+        if self.dim is None or self._size == 0:
+            self._codes = np.zeros((0, self.code_dim or 0), dtype=np.int8)
+            self._scales = np.zeros(0, dtype=np.float32)
+        else:
+            self._codes = np.fromfile(self._file("codes.i8"), dtype=np.int8).reshape(-1, self.code_dim)[:self._size]
+            self._scales = np.fromfile(self._file("scales.f32"), dtype=np.float32)[:self._size]
+
+    def _update_ivf(self, vectors: np.ndarray):
+        pass
+
+    def _on_vectors_added(self, vectors: np.ndarray):
+        codes, scales = quantize_int8(_normalize(vectors[:, :self.code_dim]))
+        with open(self._file("codes.i8"), "ab") as f:
+            codes.tofile(f)
+        with open(self._file("scales.f32"), "ab") as f:
+            scales.tofile(f)
+
+        # Grow the in-RAM code matrix geometrically
+        needed = self._size + len(codes)
+        if len(self._codes) == 0:
+            # First vectors of a new store; the code width is only known now
+            self._codes = np.zeros((0, self.code_dim), dtype=np.int8)
+        if needed > len(self._codes):
+            capacity = max(needed, 2 * len(self._codes), 1024)
+            grown_codes = np.zeros((capacity, self.code_dim), dtype=np.int8)
+            grown_codes[:self._size] = self._codes[:self._size]
+            grown_scales = np.zeros(capacity, dtype=np.float32)
+            grown_scales[:self._size] = self._scales[:self._size]
+            self._codes, self._scales = grown_codes, grown_scales
+        self._codes[self._size:needed] = codes
+        self._scales[self._size:needed] = scales
+
+    def _coarse_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate cosine scores of every row from the int8 codes.
+
+        With `rows` (sorted row numbers) only those rows are scored; the rest get -inf.
+        """
+        q = _normalize(query[:self.code_dim])
+        if rows is not None:
+            scores = np.full(self._size, -np.inf, dtype=np.float32)
+            for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                block = rows[start:start + SCAN_BLOCK_ROWS]
+                scores[block] = (self._codes[block].astype(np.float32) @ q) * self._scales[block]
+            return scores
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            block = self._codes[start:min(start + SCAN_BLOCK_ROWS, self._size)].astype(np.float32)
+            scores[start:start + len(block)] = block @ q
+        scores *= self._scales[:self._size]
+        scores[~self._alive_mask()] = -np.inf
+        return scores
+
+    def _search_rows(self, query: np.ndarray, k: int, rerank: bool = True,
+                     rows: Optional[np.ndarray] = None) -> List[tuple]:
+        """Top k rows by cosine score; `rows` optionally restricts the search to those live rows."""
+        alive = self.count() if rows is None else len(rows)
+        if alive == 0:
+            return []
+        k = min(k, alive)
+        scores = self._coarse_scores(query, rows)
+        n_candidates = min(alive, k * self.rerank_factor if rerank else k)
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        if rerank:
+            # Exact float32 scores for the shortlist, read from the memory-mapped vectors
+            candidates = np.sort(candidates)
+            scores = np.full(self._size, -np.inf, dtype=np.float32)
+            scores[candidates] = self._vector_map()[candidates] @ query
+        best = candidates[np.argsort(-scores[candidates])][:k]
+        return [(int(row), float(scores[row])) for row in best]
+
+    def _row_overhead_bytes(self) -> int:
+        """RAM held per row outside the codes: ids, metadata dicts, document spans and the id map."""
+        overhead = sum(sys.getsizeof(x) for x in (self.ids, self.metadatas, self._doc_spans, self._id_to_row))
+        overhead += self._alive.nbytes
+        for id_, metadata, doc_span in zip(self.ids, self.metadatas, self._doc_spans):
+            overhead += sys.getsizeof(id_) + sys.getsizeof(doc_span) + sum(sys.getsizeof(v) for v in doc_span)
+            overhead += sys.getsizeof(metadata) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in metadata.items())
+        return overhead
+
+    def memory_report(self) -> dict:
+        """RAM of the search index: codes and scales, plus the per-row Python bookkeeping.
+
+        `compression` compares codes to float32 vectors only; `total_compression`
+        includes the bookkeeping, which both layouts would keep in RAM.
+        """
+        with self._lock:
+            rows = self.count()
+            code_bytes = self._size * ((self.code_dim or 0) + 4)
+            float_bytes = self._size * (self.dim or 0) * 4
+            overhead = self._row_overhead_bytes()
+        return {
+            "vectors": rows,
+            "rows": self._size,
+            "code_bytes": code_bytes,
+            "float32_bytes": float_bytes,
+            "row_overhead_bytes": overhead,
+            "resident_bytes": code_bytes + overhead,
+            "compression": float_bytes / code_bytes if code_bytes else 0.0,
+            "total_compression": (float_bytes + overhead) / (code_bytes + overhead) if code_bytes else 0.0,
+        }
+
+    def recall_benchmark(self, n_queries: int = 100, k: int = 10, seed: int = 0,
+                         sample_rows: int = RECALL_SAMPLE_ROWS) -> dict:
+        """Measure recall@k of compact search against exact float32 search.
+
+        Both searches run over a random sample of at most `sample_rows` rows, so
+        the exact baseline is one pass over the sample rather than one scan of
+        the store per query. Queries are rows of the sample, with the query's
+        own row left out of both result lists; it would otherwise be a
+        guaranteed hit.
+        """
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive_mask())
+            if len(alive_rows) < 2:
+                return {"queries": 0, "k": k, "recall": 0.0, "recall_no_rerank": 0.0}
+            rng = np.random.default_rng(seed)
+            if len(alive_rows) > sample_rows:
+                alive_rows = np.sort(rng.choice(alive_rows, size=sample_rows, replace=False))
+            queries = rng.choice(alive_rows, size=min(n_queries, len(alive_rows)), replace=False)
+            vectors = self._vector_map()
+            query_vectors = np.asarray(vectors[queries])
+            k = min(k, len(alive_rows) - 1)
+
+            # Exact scores of every (sampled row, query) pair in one blocked pass
+            exact = np.empty((len(alive_rows), len(queries)), dtype=np.float32)
+            for start in range(0, len(alive_rows), SCAN_BLOCK_ROWS):
+                block = alive_rows[start:start + SCAN_BLOCK_ROWS]
+                exact[start:start + len(block)] = vectors[block] @ query_vectors.T
+
+            hits = hits_coarse = 0
+            position = {row: i for i, row in enumerate(alive_rows.tolist())}
+            for i, row in enumerate(queries):
+                scores = exact[:, i].copy()
+                scores[position[row]] = -np.inf
+                truth = set(alive_rows[np.argpartition(-scores, k - 1)[:k]].tolist())
+                # One extra result makes up for the query's own row
+                found = [r for r, _ in self._search_rows(query_vectors[i], k + 1, rows=alive_rows) if r != row][:k]
+                found_coarse = [r for r, _ in self._search_rows(query_vectors[i], k + 1, rerank=False, rows=alive_rows)
+                                if r != row][:k]
+                hits += len(truth & set(found))
+                hits_coarse += len(truth & set(found_coarse))
+
+            total = len(queries) * k
+            return {"queries": len(queries), "k": k, "rows": len(alive_rows),
+                    "recall": hits / total, "recall_no_rerank": hits_coarse / total}
@@ -0,0 +1,186 @@
+"""Pack vector search hits into as much distinct evidence per token as possible.
+
+Raw hits often include neighbouring or overlapping chunks of the same file and
+near-identical text from copies of a file. The packer:
+
+1. merges hits from the same source (and the same PDF page or notebook cell)
+   whose line ranges (or legacy chunk indices) touch or overlap into one
+   contiguous span,
+2. drops spans that are near-duplicates of a better scoring span,
+3. fills the result greedily by score until the token budget is used up.
+"""
+import re
+from typing import Callable, List, Optional
+
+from token_counter import count_tokens as model_token_count
+
+DEDUPE_THRESHOLD = 0.8
+SHINGLE_WORDS = 5
+# Longest text overlap looked for when joining legacy character chunks
+MAX_CHUNK_OVERLAP = 400
+
+
+class Span:
+    def __init__(self, source: str, text: str, score: float, metadata: dict):
+        self.source = source
+        self.text = text
+        self.score = score
+        self.start_line = metadata.get("start_line")
+        self.end_line = metadata.get("end_line")
+        self.first_chunk = self.last_chunk = metadata.get("chunk")
+        self.symbols = [metadata["symbol"]] if metadata.get("symbol") else []
+        # Line numbers of documents restart on every page or cell
+        self.page = metadata.get("page")
+        self.cell = metadata.get("cell")
+
+    @property
+    def location(self) -> str:
+        if self.page is not None:
+            location = f"page {self.page}, lines {self.start_line}-{self.end_line}"
+        elif self.cell is not None:
+            location = f"cell {self.cell}, lines {self.start_line}-{self.end_line}"
+        elif self.start_line is not None:
+            location = f"lines {self.start_line}-{self.end_line}"
+        elif self.first_chunk != self.last_chunk:
+            location = f"chunks {self.first_chunk}-{self.last_chunk}"
+        else:
+            location = f"chunk {self.first_chunk}"
+        if self.symbols:
+            location += f", {', '.join(dict.fromkeys(self.symbols))}"
+        return location
+
+    def render(self, number: int) -> str:
+        return f"Result {number} (from {self.source}, {self.location}):\n{self.text}\n"
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """Concatenate two strings, dropping the longest suffix of `first` that starts `second`."""
+    for n in range(min(len(first), len(second), MAX_CHUNK_OVERLAP), 0, -1):
+        if first.endswith(second[:n]):
+            return first + second[n:]
+    return first + second
+
+
+def _try_merge(span: Span, other: Span) -> bool:
+    """Extend `span` with `other` if they are contiguous; `other` must not start earlier."""
+    if span.start_line is not None and other.start_line is not None:
+        if other.start_line > span.end_line + 1:
+            return False
+        if other.end_line > span.end_line:
+            # Keep only the lines of `other` that go past `span`
+            skip = span.end_line - other.start_line + 1
+            span.text += "".join(other.text.splitlines(keepends=True)[skip:])
+            span.end_line = other.end_line
+    elif span.start_line is None and other.start_line is None and span.last_chunk is not None:
+        if other.first_chunk is None or other.first_chunk > span.last_chunk + 1:
+            return False
+        if other.last_chunk > span.last_chunk:
+            span.text = _join_overlapping(span.text, other.text)
+            span.last_chunk = other.last_chunk
+    else:
+        return False
+    span.score = max(span.score, other.score)
+    span.symbols.extend(other.symbols)
+    return True
+
+
+def merge_adjacent(hits: List[dict]) -> List[Span]:
+    """Merge touching or overlapping hits from the same source into spans."""
+    by_source = {}
+    for rank, hit in enumerate(hits):
+        metadata = hit.get("metadata") or {}
+        # Backends without scores are ranked by position
+        score = hit["score"] if hit.get("score") is not None else -float(rank)
+        span = Span(metadata.get("source", "Unknown"), hit["document"], score, metadata)
+        by_source.setdefault((span.source, span.page, span.cell), []).append(span)
+
+    spans = []
+    for group in by_source.values():
+        group.sort(key=lambda s: (s.start_line if s.start_line is not None else -1,
+                                  s.first_chunk if s.first_chunk is not None else -1))
+        current = group[0]
+        for span in group[1:]:
+            if not _try_merge(current, span):
+                spans.append(current)
+                current = span
+        spans.append(current)
+    return spans
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack(hits: List[dict], token_budget: Optional[int] = None, max_spans: Optional[int] = None,
+         count_tokens: Callable[[str], int] = model_token_count,
+         dedupe_threshold: float = DEDUPE_THRESHOLD) -> List[Span]:
+    """Return the spans to show, best first, within the token budget."""
+    spans = sorted(merge_adjacent(hits), key=lambda s: -s.score)
+
+    selected, selected_shingles = [], []
+    used = 0
+    for span in spans:
+        if max_spans is not None and len(selected) >= max_spans:
+            break
+        shingles = _shingles(span.text)
+        if any(_similarity(shingles, other) >= dedupe_threshold for other in selected_shingles):
+            continue
+        cost = count_tokens(span.render(len(selected) + 1))
+        if token_budget is not None and used + cost > token_budget:
+            if selected:
+                # A smaller, lower scoring span may still fit
+                continue
+            span = _truncate(span, token_budget, count_tokens)
+            if span is None:
+                # Even its header does not fit; lower hits may still
+                continue
+            cost = count_tokens(span.render(1))
+        selected.append(span)
+        selected_shingles.append(shingles)
+        used += cost
+    return selected
+
+
+def _truncate(span: Span, token_budget: int, count_tokens: Callable[[str], int]) -> Optional[Span]:
+    """Cut a span down to its leading lines so it fits the budget on its own.
+
+    A single line that is still too long (minified code, a JSON blob) is cut
+    to its longest fitting prefix.
+    """
+    lines = span.text.splitlines(keepends=True)
+    while len(lines) > 1:
+        lines = lines[:len(lines) // 2]
+        span.text = "".join(lines)
+        if span.start_line is not None:
+            span.end_line = span.start_line + len(lines) - 1
+        if count_tokens(span.render(1)) <= token_budget:
+            return span
+    line = lines[0] if lines else ""
+    # Binary search for the longest prefix of the line that fits
+    low, high = 0, len(line)
+    while low < high:
+        middle = (low + high + 1) // 2
+        span.text = line[:middle]
+        if count_tokens(span.render(1)) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    if low == 0:
+        return None
+    span.text = line[:low]
+    if span.start_line is not None:
+        span.end_line = span.start_line
+    return span
+
+
+def format_spans(spans: List[Span]) -> str:
+    return "\n".join(span.render(i + 1) for i, span in enumerate(spans))
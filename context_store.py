@@ -0,0 +1,211 @@
+"""Shared, content-addressed store of context produced by agents.
+
+Every tool output (file read, grep, search result, sub-agent answer) is stored
+once under a short hash handle. Agents that run into content they have already
+seen get the handle back instead of the full text, and any agent can fetch or
+semantically search the stored blobs with `get_context` / `search_context`.
+"""
+import collections
+import contextlib
+import contextvars
+import hashlib
+import os
+import threading
+from typing import Optional
+
+import chromadb
+
+from tools import _get_embedding_function, index_generation
+
+# Outputs shorter than this are cheaper to repeat than to reference
+MIN_REFERENCE_CHARS = 200
+# Only the head of each blob is embedded for search_context
+MAX_INDEX_CHARS = 2000
+# Least recently used blobs are dropped once the store holds more than this
+MAX_STORE_BYTES = int(os.getenv("CONTEXT_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Tools whose results only depend on their arguments and the files on disk
+READ_ONLY_TOOLS = {'read_file', 'search_code', 'list_directory', 'search_vectorstore', 'repo_map', 'find_symbol',
+                   'get_context', 'search_context'}
+# Tools whose results change whenever the vector index or symbol index is updated
+INDEX_TOOLS = {'search_vectorstore', 'repo_map', 'find_symbol'}
+
+# Identical read-only calls are only reused within one top-level turn (see ContextStore.turn)
+_turn_results = contextvars.ContextVar("turn_results", default=None)
+
+
+def make_handle(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", "replace")).hexdigest()[:12]
+
+
+class ContextStore:
+    """Blobs keyed by content hash, plus an embedding index over them."""
+
+    def __init__(self, max_bytes: int = MAX_STORE_BYTES):
+        self._lock = threading.Lock()
+        self._blobs = collections.OrderedDict()  # handle -> {"content", "kind", "label", "agent"}, oldest first
+        self._bytes = 0
+        self.max_bytes = max_bytes
+        self._seen = {}  # agent id -> handles already in that agent's context
+        self._unindexed = []
+        self._evicted = []
+        self._collection = None
+
+    def publish(self, content: str, kind: str, label: str, agent_id: str) -> str:
+        """Store content (once) and return its handle."""
+        handle = make_handle(content)
+        with self._lock:
+            if handle in self._blobs:
+                self._blobs.move_to_end(handle)
+            else:
+                self._blobs[handle] = {"content": content, "kind": kind, "label": label, "agent": agent_id}
+                self._bytes += len(content)
+                self._unindexed.append(handle)
+                self._evict()
+        return handle
+
+    def _evict(self):
+        # Keep the newest blob even if it alone exceeds the limit
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            handle, blob = self._blobs.popitem(last=False)
+            self._bytes -= len(blob["content"])
+            self._evicted.append(handle)
+
+    def get(self, handle: str) -> Optional[dict]:
+        with self._lock:
+            blob = self._blobs.get(handle)
+            if blob is not None:
+                self._blobs.move_to_end(handle)
+            return blob
+
+    def mark_seen(self, agent_id: str, handle: str) -> bool:
+        """Record that an agent has the blob in context; returns True if it already had it."""
+        with self._lock:
+            seen = self._seen.setdefault(agent_id, set())
+            if handle in seen:
+                return True
+            seen.add(handle)
+            return False
+
+    def forget(self, agent_id: str):
+        """Drop what an agent has seen, once its chat is gone."""
+        with self._lock:
+            self._seen.pop(agent_id, None)
+
+    @contextlib.contextmanager
+    def turn(self):
+        """Scope result reuse to one top-level turn, including the sub-agents it delegates to.
+
+        Files can change between turns (editors, other processes, the index
+        watcher), so results are never reused across turns.
+        """
+        if _turn_results.get() is not None:
+            yield  # A delegated worker shares its planner's turn
+            return
+        token = _turn_results.set({})
+        try:
+            yield
+        finally:
+            _turn_results.reset(token)
+
+    def cached_result(self, tool: str, args: dict, cwd: str) -> Optional[str]:
+        """Return the stored output of an identical read-only call earlier in this turn, if any."""
+        results = _turn_results.get()
+        if tool not in READ_ONLY_TOOLS or results is None:
+            return None
+        handle = results.get(_result_key(tool, args, cwd))
+        blob = self.get(handle) if handle else None
+        return blob["content"] if blob else None
+
+    def record_result(self, tool: str, args: dict, cwd: str, handle: Optional[str]):
+        results = _turn_results.get()
+        if results is None:
+            return
+        with self._lock:
+            if tool in READ_ONLY_TOOLS:
+                if handle is not None:
+                    results[_result_key(tool, args, cwd)] = handle
+            else:
+                # Commands and indexing can change files, so earlier results may be stale
+                results.clear()
+
+    def _index_pending(self):
+        """Embed blobs published since the last search."""
+        with self._lock:
+            if self._collection is None:
+                self._collection = chromadb.EphemeralClient().get_or_create_collection(
+                    name="context_store",
+                    embedding_function=_get_embedding_function()
+                )
+            pending = [(h, self._blobs[h]) for h in self._unindexed if h in self._blobs]
+            evicted, self._unindexed, self._evicted = self._evicted, [], []
+        if evicted:
+            self._collection.delete(ids=evicted)
+        if pending:
+            self._collection.upsert(
+                ids=[h for h, _ in pending],
+                documents=[blob["content"][:MAX_INDEX_CHARS] for _, blob in pending],
+                metadatas=[{"kind": blob["kind"], "label": blob["label"]} for _, blob in pending]
+            )
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Return (handle, metadata) pairs for the blobs most similar to the query."""
+        self._index_pending()
+        if not self._blobs:
+            return []
+        results = self._collection.query(query_texts=[query], n_results=min(k, len(self._blobs)))
+        return [(handle, meta) for handle, meta in zip(results['ids'][0], results['metadatas'][0])
+                if handle in self._blobs]
+
+
+def _freshness(tool: str, args: dict, cwd: str):
+    """What a cached result depends on besides its arguments, checked on every lookup."""
+    if tool in INDEX_TOOLS:
+        return index_generation()
+    if tool == 'read_file':
+        try:
+            return os.stat(os.path.join(cwd, str(args.get('file_path', '')))).st_mtime_ns
+        except OSError:
+            return None
+    return None
+
+
+def _result_key(tool: str, args: dict, cwd: str):
+    return tool, tuple(sorted((k, str(v)) for k, v in args.items())), cwd, _freshness(tool, args, cwd)
+
+
+# Process-wide store shared by every agent and session
+shared_store = ContextStore()
+
+
+def share_tool_output(agent_id: str, tool: str, args: dict, result: str) -> str:
+    """Publish a tool output and return what should go into the calling agent's context."""
+    label = f"{tool}({', '.join(f'{k}={v!r}' for k, v in args.items())})"
+    handle = shared_store.publish(result, kind=tool, label=label, agent_id=agent_id)
+    already_seen = shared_store.mark_seen(agent_id, handle)
+    if already_seen and len(result) >= MIN_REFERENCE_CHARS:
+        return (f"[context {handle}] Identical to output you already received ({len(result)} chars). "
+                f"Call get_context('{handle}') if you need the text again.")
+    return f"[context {handle}]\n{result}"
+
+
+def get_context(handle: str, offset: int = 0) -> str:
+    """Return the content stored under a context handle, starting at a character offset."""
+    blob = shared_store.get(handle.strip())
+    if blob is None:
+        return f"Error: Unknown context handle {handle}"
+    offset = int(offset)
+    if offset:
+        return f"[context {handle} from {blob['label']}, from character {offset}]\n{blob['content'][offset:]}"
+    return f"[context {handle} from {blob['label']}]\n{blob['content']}"
+
+
+def search_context(query: str, k: int = 5) -> str:
+    """Semantically search the shared context store, returning handles and labels."""
+    try:
+        hits = shared_store.search(query, int(k))
+        if not hits:
+            return "No shared context found"
+        return "\n".join(f"{handle}: {meta.get('label', '')}" for handle, meta in hits)
+    except Exception as e:
+        return f"Error searching shared context: {e}"
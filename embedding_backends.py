@@ -0,0 +1,266 @@
+"""Inference backends for the Jina embedding model.
+
+    torch       the PyTorch model from transformers (default)
+    onnx        the model exported once to ONNX and run with onnxruntime
+    onnx-int8   the ONNX export with weights dynamically quantized to int8
+
+Every backend is a Chroma-compatible embedding function (one mean-pooled vector
+per document, as sentence-transformers produces for this model) and also
+returns token-level embeddings, which late chunking pools per sentence.
+
+The ONNX export needs torch once; afterwards the exported file is loaded from
+ONNX_MODEL_DIR and only onnxruntime is used.
+
+Settings:
+    EMBEDDING_BACKEND   backend name, see above
+    EMBEDDING_THREADS   intra-op threads for inference (default: all cores)
+    ONNX_MODEL_DIR      where exported models are cached (default ./onnx_models)
+    EMBEDDING_MODEL_REVISION   model revision (branch, tag or commit) to load
+
+Run `python embedding_backends.py` to compare a backend against torch for
+accuracy and throughput.
+"""
+import argparse
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from telemetry import span, increment
+
+DEFAULT_MODEL = "jinaai/jina-embeddings-v2-base-en"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./onnx_models")
+EMBEDDING_MODEL_REVISION = os.getenv("EMBEDDING_MODEL_REVISION") or None
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+MAX_LENGTH = 8192
+BATCH_SIZE = 16
+
+_backends = {}
+_lock = threading.Lock()
+
+
+class EmbeddingBackend:
+    """Tokenization, batching and pooling shared by all backends."""
+
+    name = None
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, max_length: int = MAX_LENGTH, batch_size: int = BATCH_SIZE,
+                 revision: Optional[str] = EMBEDDING_MODEL_REVISION):
+        from transformers import AutoTokenizer
+        self.model_name = model_name
+        self.revision = revision
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision, trust_remote_code=True)
+
+    def _run(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Return the last hidden state, shape (batch, tokens, dim)."""
+        raise NotImplementedError
+
+    def _batches(self, texts: List[str]):
+        # Similar lengths go together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in indices], padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="np")
+            mask = encoded["attention_mask"].astype(np.int64)
+            with span("embedding.forward", backend=self.name, texts=len(indices), tokens=int(mask.sum())):
+                hidden = self._run(encoded["input_ids"].astype(np.int64), mask)
+            increment("embedding_texts", len(indices))
+            increment("embedding_tokens", int(mask.sum()))
+            yield indices, hidden, mask
+
+    def token_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """Per-token embeddings of each text (special tokens included, padding removed)."""
+        outputs = [None] * len(texts)
+        for indices, hidden, mask in self._batches(texts):
+            for row, i in enumerate(indices):
+                outputs[i] = hidden[row, :int(mask[row].sum())]
+        return outputs
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        vectors = [None] * len(input)
+        for indices, hidden, mask in self._batches(list(input)):
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+            for row, i in enumerate(indices):
+                vectors[i] = pooled[row].tolist()
+        return vectors
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, threads: int = EMBEDDING_THREADS, **kwargs):
+        super().__init__(model_name, **kwargs)
+        import torch
+        from transformers import AutoModel
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.model = AutoModel.from_pretrained(model_name, revision=self.revision, trust_remote_code=True).eval()
+
+    def _run(self, input_ids, attention_mask):
+        torch = self._torch
+        with torch.inference_mode():
+            output = self.model(input_ids=torch.from_numpy(input_ids), attention_mask=torch.from_numpy(attention_mask))
+        return output[0].float().numpy()
+
+
+def _model_dir(model_name: str, directory: str, revision: Optional[str] = None) -> str:
+    name = model_name.replace("/", "--") + (f"@{revision}" if revision else "")
+    return os.path.join(directory, name)
+
+
+def export_onnx(model_name: str = DEFAULT_MODEL, directory: str = ONNX_MODEL_DIR, quantize: bool = False,
+                revision: Optional[str] = EMBEDDING_MODEL_REVISION) -> str:
+    """Export the model to ONNX (and optionally quantize it) unless already done; return the file path."""
+    target_dir = _model_dir(model_name, directory, revision)
+    fp32_path = os.path.join(target_dir, "model.onnx")
+    path = os.path.join(target_dir, "model.int8.onnx") if quantize else fp32_path
+    if os.path.exists(path):
+        return path
+    os.makedirs(target_dir, exist_ok=True)
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        class LastHiddenState(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask):
+                return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision, trust_remote_code=True)
+        model = AutoModel.from_pretrained(model_name, revision=revision, trust_remote_code=True).eval()
+        sample = tokenizer(["def add(a, b):", "return a + b  # two longer lines of sample code"],
+                           padding=True, return_tensors="pt")
+        tmp_path = fp32_path + ".tmp"
+        with torch.inference_mode():
+            torch.onnx.export(
+                LastHiddenState(model), (sample["input_ids"], sample["attention_mask"]), tmp_path,
+                input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+                dynamic_axes={"input_ids": {0: "batch", 1: "tokens"}, "attention_mask": {0: "batch", 1: "tokens"},
+                              "last_hidden_state": {0: "batch", 1: "tokens"}},
+                opset_version=17,
+            )
+        os.replace(tmp_path, fp32_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_path = path + ".tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+    return path
+
+
+class OnnxBackend(EmbeddingBackend):
+    def __init__(self, model_name: str = DEFAULT_MODEL, quantize: bool = False, threads: int = EMBEDDING_THREADS,
+                 directory: str = ONNX_MODEL_DIR, **kwargs):
+        super().__init__(model_name, **kwargs)
+        import onnxruntime as ort
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.path = export_onnx(model_name, directory, quantize=quantize, revision=self.revision)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+
+    def _run(self, input_ids, attention_mask):
+        return self.session.run(["last_hidden_state"], {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+
+
+def load_backend(name: str, model_name: str = DEFAULT_MODEL, **kwargs) -> EmbeddingBackend:
+    if name == "torch":
+        return TorchBackend(model_name, **kwargs)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, quantize=name == "onnx-int8", **kwargs)
+    raise ValueError(f"Unknown embedding backend {name!r}; choose from {', '.join(BACKENDS)}")
+
+
+def get_backend(name: str = EMBEDDING_BACKEND, model_name: str = DEFAULT_MODEL,
+                revision: Optional[str] = EMBEDDING_MODEL_REVISION) -> EmbeddingBackend:
+    """Return the process-wide backend for this name, model and revision, loading it on first use."""
+    key = (name, model_name, revision)
+    with _lock:
+        if key not in _backends:
+            _backends[key] = load_backend(name, model_name, revision=revision)
+        return _backends[key]
+
+
+def _cosines(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def embeddings_per_second(backend: EmbeddingBackend, texts: List[str], repeat: int = 3) -> float:
+    backend(texts[:backend.batch_size])  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        backend(texts)
+    return repeat * len(texts) / (time.perf_counter() - start)
+
+
+def compare_backends(texts: List[str], candidate: EmbeddingBackend, reference: EmbeddingBackend) -> dict:
+    """Cosine agreement of document and token embeddings, and relative throughput."""
+    doc_cosines = _cosines(np.asarray(candidate(texts)), np.asarray(reference(texts)))
+    token_cosines = np.concatenate([_cosines(c, r) for c, r in
+                                    zip(candidate.token_embeddings(texts), reference.token_embeddings(texts))])
+    candidate_rate = embeddings_per_second(candidate, texts)
+    reference_rate = embeddings_per_second(reference, texts)
+    return {
+        "min_document_cosine": float(doc_cosines.min()),
+        "mean_document_cosine": float(doc_cosines.mean()),
+        "min_token_cosine": float(token_cosines.min()),
+        "embeddings_per_second": candidate_rate,
+        "reference_embeddings_per_second": reference_rate,
+        "speedup": candidate_rate / reference_rate,
+    }
+
+
+def _sample_texts(directory: str, limit: int) -> List[str]:
+    """Code chunks from the files under directory, as index_codebase would embed them."""
+    from code_chunker import chunk_code
+    texts = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d not in ("__pycache__", "node_modules")]
+        for file in sorted(files):
+            if not file.endswith((".py", ".md", ".js", ".ts", ".java")):
+                continue
+            with open(os.path.join(root, file), encoding="utf-8", errors="replace") as f:
+                texts.extend(c["text"] for c in chunk_code(f.read(), file))
+            if len(texts) >= limit:
+                return texts[:limit]
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check an embedding backend against the PyTorch model.")
+    parser.add_argument("--backend", default="onnx-int8", choices=BACKENDS)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--corpus", default=".", help="directory whose source files are embedded")
+    parser.add_argument("--samples", type=int, default=128)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    texts = _sample_texts(args.corpus, args.samples)
+    report = compare_backends(texts, load_backend(args.backend, args.model), load_backend("torch", args.model))
+    print(f"{len(texts)} chunks from {args.corpus}, {args.backend} vs torch")
+    for key, value in report.items():
+        print(f"  {key}: {value:.4f}")
+    if report["min_document_cosine"] < args.min_cosine:
+        raise SystemExit(f"{args.backend} embeddings diverge from torch (min cosine < {args.min_cosine})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Versioned vector indexes with background re-embedding and atomic cutover.
+
+Every index version is tagged with a hash of what produced its vectors:
+embedding model, revision and backend, vector dimension, chunker version and
+chunk size, and store settings. registry.json next to the store records which
+version is active:
+
+    {"active": "3f9c0a1b2c4d", "previous": "legacy", "building": null,
+     "versions": {"3f9c0a1b2c4d": {"spec": {...}, "location": "...", "status": "ready", "created": ...}}}
+
+When the configured spec no longer matches the active version, a new version
+is built in a background thread by re-ingesting every indexed file. Meanwhile:
+- queries are served from the old version, using the old version's model
+- writes go to both versions
+Once the rebuild is done the registry is replaced atomically (os.replace) and
+queries switch over. If a file held by the active version failed to re-embed,
+or has no chunks in the new one, the new version is marked failed instead.
+The previous version is kept for rollback; older ones are dropped. Nothing is
+ever deleted to resolve an error.
+
+A store from before versioning (Chroma collection "codebase" or files directly
+in the numpy store directory) is adopted as the "legacy" version and served
+until its replacement is built.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from telemetry import span, increment, record_error
+from vectorstore import VectorStore, open_store
+
+LEGACY_TAG = "legacy"
+
+
+def version_tag(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+class ChromaVersions:
+    """Index versions stored as Chroma collections named <prefix>-<tag>."""
+
+    def __init__(self, client, prefix: str = "codebase"):
+        self.client = client
+        self.prefix = prefix
+        self.legacy_location = prefix
+
+    def location(self, tag: str) -> str:
+        return f"{self.prefix}-{tag}"
+
+    def has_legacy(self) -> bool:
+        try:
+            return self.client.get_collection(name=self.legacy_location).count() > 0
+        except Exception:
+            return False
+
+    def open(self, location: str, embedding_function) -> VectorStore:
+        return open_store("chroma", embedding_function, chroma_client=self.client, collection_name=location)
+
+    def drop(self, location: str):
+        # The legacy collection predates versioning; it is never deleted
+        if location == self.legacy_location:
+            return
+        try:
+            self.client.delete_collection(name=location)
+        except Exception:
+            pass  # Already gone
+
+
+class DirectoryVersions:
+    """Index versions of the numpy/compact backends, one directory v-<tag> each."""
+
+    def __init__(self, backend: str, root: str, **options):
+        self.backend = backend
+        self.root = root
+        self.options = options
+        self.legacy_location = root
+
+    def location(self, tag: str) -> str:
+        return os.path.join(self.root, f"v-{tag}")
+
+    def has_legacy(self) -> bool:
+        return os.path.exists(os.path.join(self.root, "config.json"))
+
+    def open(self, location: str, embedding_function) -> VectorStore:
+        return open_store(self.backend, embedding_function, path=location, **self.options)
+
+    def drop(self, location: str):
+        # A legacy store shares its directory with the registry; leave it in place
+        if os.path.abspath(location) != os.path.abspath(self.root):
+            shutil.rmtree(location, ignore_errors=True)
+
+
+class VersionedStore(VectorStore):
+    """Serves the active index version and migrates to the configured one in the background.
+
+    `embedding_function_for(spec)` returns the embedding function a version was
+    built with, `list_sources()` the files to re-ingest and `ingest(path, store)`
+    (re)adds one file to the given store.
+    """
+
+    def __init__(self, registry_dir: str, spec: dict, storage, embedding_function_for: Callable[[dict], object],
+                 list_sources: Callable[[], Iterable[str]], ingest: Callable[[str, VectorStore], object],
+                 legacy_spec: Optional[dict] = None, background: bool = True):
+        self.registry_path = os.path.join(registry_dir, "registry.json")
+        self.spec = spec
+        self.tag = version_tag(spec)
+        self.storage = storage
+        self._embedding_function_for = embedding_function_for
+        self._list_sources = list_sources
+        self._ingest = ingest
+        # Held to write a whole file, so the rebuild and direct writes never interleave
+        self.write_lock = threading.RLock()
+        self._building = None
+        self._building_tag = None
+        self._progress = (0, 0)
+        self._thread = None
+        os.makedirs(registry_dir, exist_ok=True)
+
+        registry = self._load_registry()
+        if registry["active"] is None:
+            if legacy_spec is not None and storage.has_legacy():
+                registry["versions"][LEGACY_TAG] = self._entry(legacy_spec, storage.legacy_location, "ready")
+                registry["active"] = LEGACY_TAG
+            else:
+                # Nothing indexed yet, so nothing to migrate
+                registry["versions"][self.tag] = self._entry(spec, storage.location(self.tag), "ready")
+                registry["active"] = self.tag
+            self._save_registry(registry)
+        self.active_tag = registry["active"]
+        self._active = self._open(registry["versions"][self.active_tag])
+
+        if self.active_tag != self.tag:
+            self._start_rebuild(registry, background)
+
+    def _entry(self, spec: dict, location: str, status: str) -> dict:
+        return {"spec": spec, "location": location, "status": status, "created": time.time()}
+
+    def _open(self, entry: dict) -> VectorStore:
+        return self.storage.open(entry["location"], self._embedding_function_for(entry["spec"]))
+
+    def _load_registry(self) -> dict:
+        try:
+            with open(self.registry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"active": None, "previous": None, "building": None, "versions": {}}
+
+    def _save_registry(self, registry: dict):
+        """Replace the registry atomically, so readers see either the old or the new one."""
+        tmp_path = self.registry_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(registry, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.registry_path)
+
+    def _start_rebuild(self, registry: dict, background: bool):
+        stale = registry.get("building")
+        if stale and stale != self.tag:
+            # An unfinished build for a config that is no longer wanted
+            self.storage.drop(registry["versions"][stale]["location"])
+            registry["versions"].pop(stale, None)
+        # Start from an empty version; an older copy would miss writes made since
+        location = self.storage.location(self.tag)
+        self.storage.drop(location)
+        registry["versions"][self.tag] = self._entry(self.spec, location, "building")
+        registry["building"] = self.tag
+        self._save_registry(registry)
+
+        self._building = self.storage.open(location, self._embedding_function_for(self.spec))
+        self._building_tag = self.tag
+        self._thread = threading.Thread(target=self._rebuild, name="index-rebuild", daemon=True)
+        if background:
+            self._thread.start()
+        else:
+            self._thread.run()
+
+    def _rebuild(self):
+        target, tag = self._building, self._building_tag
+        # The active version may hold files the caller no longer tracks; files
+        # deleted from disk since are left out
+        held = {path for path in self._active.sources() if path and os.path.exists(path)}
+        sources = sorted(set(self._list_sources()) | held)
+        failures = 0
+        with span("index.rebuild", version=tag, files=len(sources)) as rebuild_span:
+            for done, path in enumerate(sources, 1):
+                with self.write_lock:
+                    try:
+                        self._ingest(path, target)
+                        increment("reembedded_files")
+                    except Exception as e:
+                        record_error("reembed", e)
+                        # Files the active version never held (skipped there as errors too) lose nothing
+                        if path in held:
+                            failures += 1
+                self._progress = (done, len(sources))
+            rebuild_span.set(failures=failures)
+            # Keep serving the old version rather than cutting over to an incomplete one
+            if failures:
+                self._fail(tag, f"{failures} of {len(held)} indexed files failed to re-embed")
+                return
+            with self.write_lock:
+                missing = {path for path in self._active.sources() - target.sources() if path and os.path.exists(path)}
+                if missing:
+                    self._fail(tag, f"{len(missing)} indexed files were not re-embedded, e.g. {min(missing)}")
+                    return
+                self._cut_over(tag, target)
+
+    def _fail(self, tag: str, reason: str):
+        with self.write_lock:
+            registry = self._load_registry()
+            registry["versions"][tag]["status"] = "failed"
+            registry["versions"][tag]["error"] = reason
+            registry["building"] = None
+            self._save_registry(registry)
+            self._building = self._building_tag = None
+
+    def _cut_over(self, tag: str, target: VectorStore):
+        with span("index.cutover", version=tag), self.write_lock:
+            registry = self._load_registry()
+            old_tag, old_previous = registry["active"], registry.get("previous")
+            registry["versions"][tag]["status"] = "ready"
+            registry["versions"][old_tag]["status"] = "previous"
+            registry["active"], registry["previous"], registry["building"] = tag, old_tag, None
+            if old_previous and old_previous not in (tag, old_tag):
+                retired = registry["versions"].pop(old_previous)
+            else:
+                retired = None
+            self._save_registry(registry)
+            self._active, self.active_tag = target, tag
+            self._building = self._building_tag = None
+        if retired:
+            self.storage.drop(retired["location"])
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until a running rebuild finishes; returns False on timeout."""
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def status(self) -> dict:
+        return {"active": self.active_tag, "configured": self.tag, "building": self._building_tag,
+                "progress": self._progress}
+
+    def add(self, ids, documents, metadatas):
+        with self.write_lock:
+            self._active.add(ids, documents, metadatas)
+            if self._building is not None:
+                self._building.add(ids, documents, metadatas)
+
+    def delete(self, source, keep_ids=None):
+        with self.write_lock:
+            self._active.delete(source, keep_ids)
+            if self._building is not None:
+                self._building.delete(source, keep_ids)
+
+    def delete_ids(self, ids):
+        with self.write_lock:
+            self._active.delete_ids(ids)
+            if self._building is not None:
+                self._building.delete_ids(ids)
+
+    def query(self, query, k=5):
+        return self._active.query(query, k)
+
+    def count(self):
+        return self._active.count()
+
+    def sources(self):
+        return self._active.sources()
+
+    def __getattr__(self, name):
+        # Backend-specific extras such as the compact store's memory_report
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._active, name)
@@ -0,0 +1,163 @@
+"""Streaming extraction of indexable text from files.
+
+Each file is turned into a stream of sections by an extractor:
+
+    .pdf      one section per page (pypdf, pure Python); pages are parsed on demand
+    .ipynb    one section per notebook cell; cells are decoded one at a time,
+              outputs are skipped
+    other     text files; small files are one section, large ones are read in
+              blocks cut at blank lines
+
+add_to_vectorstore chunks and embeds each section before reading the next, so
+peak memory follows the largest page or section rather than the document.
+Sections carry metadata (page or cell number) that is stored with every chunk.
+
+New formats are added with register_extractor(".ext", function), where the
+function takes a path and yields Sections.
+"""
+import json
+import os
+import re
+from typing import Callable, Dict, Iterator, Optional
+
+# Text files up to this size are chunked as a whole (keeps AST chunking intact)
+WHOLE_FILE_BYTES = 1_000_000
+# Block size for streaming larger text files
+TEXT_BLOCK_BYTES = 256_000
+READ_BYTES = 65_536
+
+
+class Section:
+    """Text from one part of a document.
+
+    `metadata` is stored with every chunk of the section, `start_line` is the
+    document line the text starts on (for streamed text files) and `chunk_as`
+    is the file name whose extension selects the chunking strategy.
+    """
+
+    def __init__(self, text: str, metadata: Optional[dict] = None, start_line: int = 1,
+                 chunk_as: Optional[str] = None):
+        self.text = text
+        self.metadata = metadata or {}
+        self.start_line = start_line
+        self.chunk_as = chunk_as
+
+
+def extract_text(path: str) -> Iterator[Section]:
+    if os.path.getsize(path) <= WHOLE_FILE_BYTES:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield Section(f.read(), chunk_as=path)
+        return
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        block, size, start_line = [], 0, 1
+        for lineno, line in enumerate(f, 1):
+            block.append(line)
+            size += len(line)
+            # Prefer cutting at a blank line, but never let a block grow past twice the target
+            if size >= TEXT_BLOCK_BYTES and (not line.strip() or size >= 2 * TEXT_BLOCK_BYTES):
+                yield Section("".join(block), start_line=start_line, chunk_as=path)
+                block, size, start_line = [], 0, lineno + 1
+        if block:
+            yield Section("".join(block), start_line=start_line, chunk_as=path)
+
+
+def extract_pdf(path: str) -> Iterator[Section]:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages, 1):
+        text = page.extract_text() or ""
+        if text.strip():
+            # Chunked as paragraphs
+            yield Section(text, {"page": number}, chunk_as="page.txt")
+
+
+def _json_array_items(path: str, key: str) -> Iterator[dict]:
+    """Decode the items of the top-level array `key` one at a time without loading the whole file."""
+    decoder = json.JSONDecoder()
+    opening = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    with open(path, encoding="utf-8") as f:
+        buffer, eof = "", False
+
+        def read_more() -> bool:
+            nonlocal buffer
+            data = f.read(max(READ_BYTES, len(buffer)))
+            buffer += data
+            return bool(data)
+
+        match = None
+        while match is None:
+            match = opening.search(buffer)
+            if match is None and not read_more():
+                return
+        buffer, pos = buffer[match.end():], 0
+        while True:
+            while True:
+                # Skip separators between items
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                eof = not read_more()
+            if pos >= len(buffer) or buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item continues past the buffer
+                if eof:
+                    raise
+                eof = not read_more()
+                continue
+            yield item
+            buffer, pos = buffer[end:], 0
+
+
+def extract_notebook(path: str) -> Iterator[Section]:
+    for number, cell in enumerate(_json_array_items(path, "cells"), 1):
+        source = cell.get("source", "")
+        text = "".join(source) if isinstance(source, list) else source
+        if not text.strip():
+            continue
+        cell_type = cell.get("cell_type", "code")
+        chunk_as = {"code": "cell.py", "markdown": "cell.md"}.get(cell_type, "cell.txt")
+        yield Section(text, {"cell": number, "cell_type": cell_type}, chunk_as=chunk_as)
+
+
+EXTRACTORS: Dict[str, Callable[[str], Iterator[Section]]] = {
+    ".pdf": extract_pdf,
+    ".ipynb": extract_notebook,
+}
+# Formats read_file cannot show as plain text
+BINARY_EXTENSIONS = {".pdf"}
+
+
+def register_extractor(extension: str, extractor: Callable[[str], Iterator[Section]], binary: bool = False):
+    EXTRACTORS[extension] = extractor
+    if binary:
+        BINARY_EXTENSIONS.add(extension)
+
+
+def iter_sections(path: str) -> Iterator[Section]:
+    """Yield the sections of a file using the extractor registered for its extension."""
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower(), extract_text)
+    return extractor(path)
+
+
+def is_binary_document(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS
+
+
+def read_document(path: str) -> str:
+    """Extracted text of a whole document, with a header before each page or cell."""
+    parts = []
+    for section in iter_sections(path):
+        metadata = section.metadata
+        if "page" in metadata:
+            label = f"page {metadata['page']}"
+        elif "cell" in metadata:
+            label = f"cell {metadata['cell']} ({metadata['cell_type']})"
+        else:
+            label = ""
+        parts.append(f"--- {label} ---\n{section.text}" if label else section.text)
+    return "\n".join(parts)
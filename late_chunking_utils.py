@@ -1,10 +1,10 @@
-from transformers import AutoModel, AutoTokenizer
+from transformers import AutoTokenizer
 import numpy as np
 import requests
+from embedding_backends import get_backend
 
-# Load base model and tokenizer in late method 
+# Load tokenizer in late method; the model runs on the configured backend (EMBEDDING_BACKEND)
 tokenizer = AutoTokenizer.from_pretrained('jinaai/jina-embeddings-v2-base-en', trust_remote_code=True)
-model = AutoModel.from_pretrained('jinaai/jina-embeddings-v2-base-en', trust_remote_code=True)
 
 def chunk_by_sentences(input_text: str, tokenizer: callable):
     """
@@ -61,6 +61,9 @@ def late_chunking(
     token_embeddings = model_output[0]
     outputs = []
     for embeddings, annotations in zip(token_embeddings, span_annotation):
+        # Raw transformers outputs are tensors; embedding backends return numpy arrays
+        if hasattr(embeddings, "detach"):
+            embeddings = embeddings.detach().cpu().numpy()
         if (
             max_length is not None
         ):  # remove annotations which go bejond the max-length of the model
@@ -70,22 +73,19 @@ def late_chunking(
                 if start < (max_length - 1)
             ]
         pooled_embeddings = [
-            embeddings[start:end].sum(dim=0) / (end - start)
+            embeddings[start:end].sum(axis=0) / (end - start)
             for start, end in annotations
             if (end - start) >= 1
         ]
-        pooled_embeddings = [
-            embedding.detach().cpu().numpy() for embedding in pooled_embeddings
-        ]
         outputs.append(pooled_embeddings)
 
     return outputs
 
 def get_late_chunking_embeddings(text: str):
-    inputs = tokenizer(text, return_tensors='pt')
-    model_output = model(**inputs)
-    
+    backend = get_backend()
+    model_output = (backend.token_embeddings([text]),)
+
     _, span_annotations = chunk_by_sentences(text, tokenizer)
     
-    embeddings = late_chunking(model_output, [span_annotations])[0]
+    embeddings = late_chunking(model_output, [span_annotations], max_length=backend.max_length)[0]
     return embeddings
@@ -0,0 +1,167 @@
+"""Load test of the agent loop with the offline scripted model client.
+
+Runs many concurrent sessions through the same path as server.py (Session,
+run_turn, execute_tool and the real tools) against a synthetic corpus, while
+the model is replaced by the scripted client with configurable latency. Reports:
+
+    per-turn latency (p50/p95/max) and turns per second
+    time spent in model calls vs tool calls vs the agent loop itself
+    process RSS across the run and its growth per turn
+
+    python load_test.py --sessions 32 --turns 20 --latency 0.5
+    python load_test.py --script recorded.jsonl --output load.json
+
+Record a script from real Gemini sessions with AGENT_RECORD_SCRIPT=recorded.jsonl.
+Without --script, one is generated from the corpus files.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmark import _configure, _percentile, build_corpus
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+    except OSError:
+        # Not Linux: fall back to the peak
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_script(corpus_dir: str, turns: int = 10, seed: int = 0) -> list:
+    """Turns that read, grep, map and search the corpus like a typical session."""
+    rng = random.Random(seed)
+    files = sorted(os.path.relpath(os.path.join(root, name), corpus_dir)
+                   for root, _, names in os.walk(corpus_dir) for name in names if name.endswith((".py", ".js", ".md")))
+    packages = sorted({os.path.dirname(path) for path in files})
+    script = []
+    for _ in range(turns):
+        steps = [
+            {"calls": [{"name": "search_vectorstore", "args": {"query": f"{rng.choice(['retry', 'cache', 'parse'])} logic"}},
+                       {"name": "list_directory", "args": {"path": rng.choice(packages)}}]},
+            {"calls": [{"name": "read_file", "args": {"file_path": rng.choice(files)}}]},
+            {"calls": [{"name": "search_code", "args": {"pattern": "def ", "path": rng.choice(packages)}}]},
+        ]
+        if rng.random() < 0.3:
+            steps.append({"calls": [{"name": "repo_map", "args": {"path": rng.choice(packages), "depth": 2}}]})
+        steps.append({"text": "Summary of the findings."})
+        script.append({"steps": steps})
+    return script
+
+
+async def run_session(server, corpus_dir: str, turns: int, turn_latencies: list, rss_by_turn: list):
+    session = server.Session(corpus_dir)
+    for turn in range(turns):
+        start = time.perf_counter()
+        async with session.lock:
+            await asyncio.to_thread(session.handle_message, f"Load test request {turn}")
+        turn_latencies.append(time.perf_counter() - start)
+        rss_by_turn[turn].append(current_rss_mb())
+
+
+def _span_seconds(spans: dict, prefix: str) -> float:
+    return sum(h["sum"] for name, h in spans.items() if name.startswith(prefix))
+
+
+def run(sessions: int = 16, turns: int = 10, latency: float = 0.5, jitter: float = 0.2, files: int = 100,
+        workers: int = 32, embedding: str = "hashing", script_path: str = None, seed: int = 0) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        build_corpus(corpus_dir, files=files, seed=seed, include_pdf=False)
+        if script_path is None:
+            script_path = os.path.join(workdir, "script.jsonl")
+            with open(script_path, "w") as f:
+                for turn in build_script(corpus_dir, seed=seed):
+                    f.write(json.dumps(turn) + "\n")
+
+        # The model client is chosen when agent is imported
+        os.environ["AGENT_MODEL_CLIENT"] = "scripted"
+        os.environ["AGENT_SCRIPT"] = script_path
+        os.environ["MOCK_LATENCY_SECONDS"] = str(latency)
+        os.environ["MOCK_LATENCY_JITTER"] = str(jitter)
+        tools = _configure(workdir, embedding)
+        import server
+        import telemetry
+
+        tools.warm_up()
+        tools.index_codebase(corpus_dir)
+        rss_start = current_rss_mb()
+        before = telemetry.snapshot()["spans"]
+
+        turn_latencies = []
+        rss_by_turn = [[] for _ in range(turns)]
+
+        async def drive():
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=workers))
+            await asyncio.gather(*(run_session(server, corpus_dir, turns, turn_latencies, rss_by_turn)
+                                   for _ in range(sessions)))
+
+        start = time.perf_counter()
+        asyncio.run(drive())
+        elapsed = time.perf_counter() - start
+
+        after = telemetry.snapshot()["spans"]
+        spans = {name: {"sum": h["sum"] - before.get(name, {}).get("sum", 0.0)} for name, h in after.items()}
+        model_seconds = _span_seconds(spans, "model.")
+        tool_seconds = _span_seconds(spans, "tool.")
+        turn_seconds = _span_seconds(spans, "agent.turn")
+        rss_curve = [max(values) for values in rss_by_turn if values]
+        growth = (rss_curve[-1] - rss_curve[0]) / max(len(rss_curve) - 1, 1) if rss_curve else 0.0
+
+        return {
+            "config": {"sessions": sessions, "turns": turns, "latency": latency, "jitter": jitter,
+                       "files": files, "workers": workers, "embedding": embedding},
+            "turns_per_second": len(turn_latencies) / elapsed,
+            "turn_latency_ms": {
+                "p50": statistics.median(turn_latencies) * 1000,
+                "p95": _percentile(turn_latencies, 0.95) * 1000,
+                "max": max(turn_latencies) * 1000,
+            },
+            # Model calls of delegated sub-agents also count towards the delegate tool's time
+            "time_split": {
+                "model_seconds": model_seconds,
+                "tool_seconds": tool_seconds,
+                "agent_overhead_seconds": max(turn_seconds - model_seconds - tool_seconds, 0.0),
+            },
+            "rss_mb": {"start": rss_start, "end": current_rss_mb(), "by_turn": rss_curve,
+                       "growth_per_turn": growth},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive many concurrent scripted sessions through the agent loop.")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=10, help="turns per session")
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--files", type=int, default=100, help="synthetic corpus size")
+    parser.add_argument("--workers", type=int, default=32, help="threads for tool and model calls, as in server.py")
+    parser.add_argument("--embedding", choices=("backend", "hashing"), default="hashing")
+    parser.add_argument("--script", help="JSONL script to replay (default: generated from the corpus)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.sessions, args.turns, args.latency, args.jitter, args.files, args.workers,
+                  args.embedding, args.script)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
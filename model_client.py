@@ -0,0 +1,206 @@
+"""Model clients behind the agent loop.
+
+    gemini     the Gemini API (default); with AGENT_RECORD_SCRIPT set, every turn's
+               function calls and final answer are appended to that file
+    scripted   an offline stand-in that replays a recorded script with simulated
+               latency, so the agent loop runs without an API key
+
+A client has start_chat(), returning an object with send_message() and a
+history attribute like genai's ChatSession, and generate_content() for
+tool-less requests such as history summaries.
+
+Scripts are JSONL, one turn per line:
+
+    {"steps": [{"calls": [{"name": "read_file", "args": {"file_path": "main.py"}}]},
+               {"text": "main.py starts the CLI loop."}]}
+
+Each send_message of a user prompt starts the chat's next turn (turns repeat
+once the script runs out); each batch of function responses advances to the
+next step.
+
+Settings:
+    AGENT_MODEL_CLIENT      "gemini" or "scripted"
+    AGENT_SCRIPT            script replayed by the scripted client
+    AGENT_RECORD_SCRIPT     where the gemini client records turns
+    MOCK_LATENCY_SECONDS    scripted latency per model call (default 0.5)
+    MOCK_LATENCY_JITTER     +/- uniform jitter on that latency (default 0.2)
+"""
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+import google.generativeai as genai
+
+from token_counter import DEFAULT_MODEL
+
+MODEL_CLIENT = os.getenv("AGENT_MODEL_CLIENT", "gemini")
+MOCK_LATENCY_SECONDS = float(os.getenv("MOCK_LATENCY_SECONDS", "0.5"))
+MOCK_LATENCY_JITTER = float(os.getenv("MOCK_LATENCY_JITTER", "0.2"))
+
+# Used when the scripted client has no script file
+DEFAULT_SCRIPT = [
+    {"steps": [{"calls": [{"name": "list_directory", "args": {}}]},
+               {"calls": [{"name": "repo_map", "args": {"depth": 2}}]},
+               {"text": "Here is an overview of the repository."}]},
+]
+
+
+class GeminiClient:
+    def __init__(self, tools: list, model_name: str = DEFAULT_MODEL, record_path: Optional[str] = None):
+        self.model = genai.GenerativeModel(model_name, tools=tools)
+        self.summarizer = genai.GenerativeModel(model_name)
+        self.record_path = record_path
+        self._record_lock = threading.Lock()
+
+    def start_chat(self):
+        chat = self.model.start_chat()
+        return RecordingChat(chat, self) if self.record_path else chat
+
+    def generate_content(self, prompt: str):
+        return self.summarizer.generate_content(prompt)
+
+    def record(self, turn: dict):
+        with self._record_lock, open(self.record_path, "a") as f:
+            f.write(json.dumps(turn) + "\n")
+
+
+class RecordingChat:
+    """Pass-through chat that writes each finished turn to the client's script file."""
+
+    def __init__(self, chat, client: GeminiClient):
+        self._chat = chat
+        self._client = client
+        self._steps = []
+
+    @property
+    def history(self):
+        return self._chat.history
+
+    @history.setter
+    def history(self, history):
+        self._chat.history = history
+
+    def send_message(self, content):
+        if isinstance(content, str):
+            self._steps = []
+        response = self._chat.send_message(content)
+        calls = [{"name": part.function_call.name,
+                  "args": genai.protos.FunctionCall.to_dict(part.function_call).get("args", {})}
+                 for part in response.candidates[0].content.parts if part.function_call.name]
+        if calls:
+            self._steps.append({"calls": calls})
+        else:
+            self._steps.append({"text": response.text})
+            self._client.record({"steps": self._steps})
+        return response
+
+
+class ScriptedResponse:
+    """The parts of a GenerateContentResponse the agent loop reads."""
+
+    def __init__(self, content, prompt_tokens: int, output_tokens: int):
+        self.candidates = [SimpleNamespace(content=content)]
+        self.usage_metadata = SimpleNamespace(prompt_token_count=prompt_tokens,
+                                              candidates_token_count=output_tokens)
+
+    @property
+    def text(self) -> str:
+        return "".join(part.text for part in self.candidates[0].content.parts)
+
+
+def _estimate_tokens(content) -> int:
+    return len(type(content).to_json(content)) // 4
+
+
+class ScriptedChat:
+    def __init__(self, client: "ScriptedClient"):
+        self._client = client
+        self._turns_started = 0
+        self._steps = []
+        self._step = 0
+        self.history = []
+
+    @property
+    def history(self):
+        return self._history
+
+    @history.setter
+    def history(self, history):
+        # The agent replaces the history when it summarizes older turns
+        self._history = list(history)
+        self._tokens = sum(_estimate_tokens(content) for content in self._history)
+
+    def _append(self, content):
+        self._history.append(content)
+        self._tokens += _estimate_tokens(content)
+
+    def send_message(self, content):
+        if isinstance(content, str):
+            self._steps = self._client.turn(self._turns_started)
+            self._turns_started += 1
+            self._step = 0
+            self._append(genai.protos.Content(role="user", parts=[genai.protos.Part(text=content)]))
+        else:
+            self._append(genai.protos.Content(role="user", parts=list(content)))
+
+        step = self._steps[self._step] if self._step < len(self._steps) else {"text": "Done."}
+        self._step += 1
+        if step.get("calls"):
+            parts = [genai.protos.Part(function_call=genai.protos.FunctionCall(name=call["name"], args=call.get("args", {})))
+                     for call in step["calls"]]
+        else:
+            parts = [genai.protos.Part(text=step.get("text", "Done."))]
+        reply = genai.protos.Content(role="model", parts=parts)
+
+        prompt_tokens = self._tokens
+        self._client.wait()
+        self._append(reply)
+        return ScriptedResponse(reply, prompt_tokens, _estimate_tokens(reply))
+
+
+class ScriptedClient:
+    def __init__(self, script: Optional[List[dict]] = None, latency: float = MOCK_LATENCY_SECONDS,
+                 jitter: float = MOCK_LATENCY_JITTER, seed: Optional[int] = None):
+        self.script = script or DEFAULT_SCRIPT
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ScriptedClient":
+        with open(path) as f:
+            return cls([json.loads(line) for line in f if line.strip()], **kwargs)
+
+    def turn(self, index: int) -> List[dict]:
+        return self.script[index % len(self.script)]["steps"]
+
+    def wait(self):
+        """Sleep for one simulated model call."""
+        with self._random_lock:
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def start_chat(self) -> ScriptedChat:
+        return ScriptedChat(self)
+
+    def generate_content(self, prompt: str):
+        self.wait()
+        content = genai.protos.Content(role="model", parts=[genai.protos.Part(
+            text=f"(scripted summary of {len(prompt)} characters of conversation)")])
+        return ScriptedResponse(content, len(prompt) // 4, _estimate_tokens(content))
+
+
+def load_client(tools: list, name: str = MODEL_CLIENT):
+    """Return the model client selected by AGENT_MODEL_CLIENT."""
+    if name == "gemini":
+        return GeminiClient(tools, record_path=os.getenv("AGENT_RECORD_SCRIPT"))
+    if name == "scripted":
+        script_path = os.getenv("AGENT_SCRIPT")
+        return ScriptedClient.from_file(script_path) if script_path else ScriptedClient()
+    raise ValueError(f"Unknown AGENT_MODEL_CLIENT {name!r}; choose 'gemini' or 'scripted'")
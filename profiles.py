@@ -0,0 +1,88 @@
+"""Runtime profiles that size the agent and retriever to the model's context window.
+
+A profile is picked from the model name (or an explicit window size) and sets
+how much history the chat keeps, when older turns get summarized, how large a
+single tool output may be, how much retrieved text search_vectorstore returns
+and how large index chunks are.
+
+Overrides:
+    AGENT_PROFILE          force a profile by name ("small", "medium", "large", "xlarge")
+    AGENT_CONTEXT_WINDOW   context window in tokens, for models not listed below
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from token_counter import DEFAULT_MODEL
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    # Smallest context window (tokens) this profile is meant for
+    context_window: int
+    max_iterations: int
+    # Prompt size that triggers summarizing older turns, and how much recent history to keep verbatim
+    summarize_at_tokens: int
+    history_tokens: int
+    # Longest single tool output passed to the model
+    tool_output_tokens: int
+    retrieval_k: int
+    retrieval_token_budget: int
+    chunk_tokens: int
+
+
+PROFILES = {
+    "small": Profile("small", context_window=8_192, max_iterations=6,
+                     summarize_at_tokens=5_000, history_tokens=2_000, tool_output_tokens=1_000,
+                     retrieval_k=3, retrieval_token_budget=1_000, chunk_tokens=256),
+    "medium": Profile("medium", context_window=32_768, max_iterations=10,
+                      summarize_at_tokens=22_000, history_tokens=8_000, tool_output_tokens=4_000,
+                      retrieval_k=5, retrieval_token_budget=3_000, chunk_tokens=384),
+    "large": Profile("large", context_window=128_000, max_iterations=15,
+                     summarize_at_tokens=90_000, history_tokens=32_000, tool_output_tokens=12_000,
+                     retrieval_k=8, retrieval_token_budget=8_000, chunk_tokens=512),
+    "xlarge": Profile("xlarge", context_window=1_000_000, max_iterations=25,
+                      summarize_at_tokens=600_000, history_tokens=200_000, tool_output_tokens=50_000,
+                      retrieval_k=15, retrieval_token_budget=30_000, chunk_tokens=1024),
+}
+
+# Input context windows of known models, matched by name prefix (longest prefix wins)
+MODEL_CONTEXT_WINDOWS = {
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-2.5-flash": 1_048_576,
+    "gemini-2.5-pro": 1_048_576,
+    "gemma-3": 128_000,
+    "gemma-2": 8_192,
+}
+DEFAULT_CONTEXT_WINDOW = 32_768
+
+
+def context_window_for(model_name: str) -> int:
+    if os.getenv("AGENT_CONTEXT_WINDOW"):
+        return int(os.getenv("AGENT_CONTEXT_WINDOW"))
+    name = model_name.split("/")[-1]
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def select_profile(model_name: str = DEFAULT_MODEL, context_window: Optional[int] = None) -> Profile:
+    """Return the largest profile that fits the model's context window."""
+    forced = os.getenv("AGENT_PROFILE")
+    if forced:
+        if forced not in PROFILES:
+            raise ValueError(f"Unknown AGENT_PROFILE {forced!r}; choose from {', '.join(PROFILES)}")
+        return PROFILES[forced]
+    window = context_window or context_window_for(model_name)
+    fitting = [p for p in PROFILES.values() if p.context_window <= window]
+    if not fitting:
+        return PROFILES["small"]
+    return max(fitting, key=lambda p: p.context_window)
+
+
+# Profile for the configured chat model, shared by the agent loop and the tools
+active_profile = select_profile()
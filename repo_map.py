@@ -0,0 +1,240 @@
+"""Symbol index behind the repo_map and find_symbol tools.
+
+For every indexed file we keep its definitions (classes, functions and
+methods with signatures and line numbers) and how often it mentions each
+identifier. Symbols are ranked by how many other files reference them, so a
+repo map lists the most used parts of the codebase first. That gives the agent
+a compact skeleton of a repository in one tool call instead of many
+list_directory / read_file round trips.
+
+The index is updated per file (skipped when the mtime is unchanged) by
+add_to_vectorstore, index_codebase and the watcher, and persisted as JSON
+next to the vector store.
+"""
+import ast
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# Declarations in brace languages: keyword form or "name(...) {" form
+_DECLARATION = re.compile(
+    r'^\s*(?:export\s+)?(?:default\s+)?(?:public\s+|private\s+|protected\s+|static\s+|abstract\s+|async\s+|final\s+)*'
+    r'(?:(class|interface|enum|struct|function|namespace|type)\s+([A-Za-z_$][\w$]*)'
+    r'|(?:[\w<>\[\],*&:]+\s+)?([A-Za-z_$][\w$]*)\s*\([^;]*\)\s*(?:const\s*)?(?:throws [\w., ]+)?\s*\{?\s*$)'
+)
+_IDENTIFIER = re.compile(r'[A-Za-z_$][\w$]*')
+_CONTROL_WORDS = {'if', 'for', 'while', 'switch', 'catch', 'return', 'else', 'do', 'try', 'new', 'sizeof'}
+
+BRACE_EXTENSIONS = (".js", ".ts", ".java", ".c", ".cpp", ".h")
+MAX_MAP_LINES = 300
+SAVE_INTERVAL_SECONDS = 5.0
+
+
+def _python_symbols(source: str):
+    tree = ast.parse(source)
+    definitions = []
+
+    def visit(nodes, prefix: str, depth: int):
+        for node in nodes:
+            if isinstance(node, ast.ClassDef):
+                bases = ", ".join(ast.unparse(b) for b in node.bases)
+                definitions.append({"name": prefix + node.name, "kind": "class", "line": node.lineno,
+                                    "signature": f"class {node.name}({bases})" if bases else f"class {node.name}",
+                                    "depth": depth})
+                visit(node.body, prefix + node.name + ".", depth + 1)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                keyword = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+                returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+                definitions.append({"name": prefix + node.name, "kind": "function", "line": node.lineno,
+                                    "signature": f"{keyword} {node.name}({ast.unparse(node.args)}){returns}",
+                                    "depth": depth})
+
+    visit(tree.body, "", 0)
+    references = Counter()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            references[node.id] += 1
+        elif isinstance(node, ast.Attribute):
+            references[node.attr] += 1
+    return definitions, references
+
+
+def _generic_symbols(source: str):
+    definitions = []
+    depth = 0
+    for lineno, line in enumerate(source.splitlines(), 1):
+        match = _DECLARATION.match(line)
+        if match:
+            kind = match.group(1) or "function"
+            name = match.group(2) or match.group(3)
+            if name not in _CONTROL_WORDS:
+                definitions.append({"name": name, "kind": kind, "line": lineno,
+                                    "signature": line.strip().rstrip("{").strip(), "depth": min(depth, 1)})
+        depth = max(0, depth + line.count("{") - line.count("}"))
+    references = Counter(_IDENTIFIER.findall(source))
+    # A declaration is not a reference to itself
+    for definition in definitions:
+        references[definition["name"]] -= 1
+    return definitions, +references
+
+
+def extract_symbols(path: str, source: str):
+    """Return (definitions, reference counts) for one file."""
+    if path.endswith(".py"):
+        try:
+            return _python_symbols(source)
+        except (SyntaxError, ValueError):
+            return [], Counter()
+    if path.endswith(BRACE_EXTENSIONS):
+        return _generic_symbols(source)
+    return [], Counter()
+
+
+class SymbolIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._files = {}  # path -> {"mtime", "definitions", "references"}
+        self._last_save = 0.0
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._files = json.load(f)
+            except (OSError, ValueError):
+                self._files = {}
+
+    def update_file(self, path: str, source: Optional[str] = None):
+        """(Re)index one file unless it is unchanged since the last call."""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self.remove_file(path)
+            return
+        entry = self._files.get(path)
+        if entry is not None and entry["mtime"] == mtime:
+            return
+        if source is None and not path.endswith((".py",) + BRACE_EXTENSIONS):
+            # No symbols to extract; don't read documents such as PDFs
+            source = ""
+        if source is None:
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    source = f.read()
+            except OSError:
+                return
+        definitions, references = extract_symbols(path, source)
+        with self._lock:
+            self._files[path] = {"mtime": mtime, "definitions": definitions, "references": dict(references)}
+            self._dirty = True
+        self.save(force=False)
+
+    def remove_file(self, path: str):
+        with self._lock:
+            if self._files.pop(path, None) is not None:
+                self._dirty = True
+
+    def update_tree(self, root: str, is_indexable, skip_directory):
+        """Index every eligible file under root that changed since the last call.
+
+        Entries of files that are gone or no longer eligible are dropped, which
+        covers deletions the watcher did not see (e.g. made while the agent was
+        not running).
+        """
+        seen = set()
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not skip_directory(d)]
+            for file in files:
+                path = os.path.join(directory, file)
+                # Documents and data files define no symbols; keep them out of the map
+                if is_indexable(path) and path.endswith((".py",) + BRACE_EXTENSIONS):
+                    seen.add(path)
+                    self.update_file(path)
+        for path in self._files_under(root):
+            if path not in seen:
+                self.remove_file(path)
+        self.save()
+
+    def save(self, force: bool = True):
+        """Persist the index; unforced saves are rate limited."""
+        if not self.path or not self._dirty:
+            return
+        if not force and time.monotonic() - self._last_save < SAVE_INTERVAL_SECONDS:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._files, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def _files_under(self, root: str) -> dict:
+        with self._lock:
+            return {p: e for p, e in self._files.items() if p == root or p.startswith(root.rstrip(os.sep) + os.sep)}
+
+    @staticmethod
+    def _reference_counts(files: dict) -> Counter:
+        """How many of the given files mention each identifier."""
+        counts = Counter()
+        for entry in files.values():
+            counts.update(entry["references"].keys())
+        return counts
+
+    def repo_map(self, root: str, depth: int = 2, max_lines: int = MAX_MAP_LINES) -> str:
+        files = self._files_under(root)
+        # Rank by references from this tree only, not from other repos indexed in the process
+        references = self._reference_counts(files)
+        files = {path: entry for path, entry in files.items() if entry["definitions"]}
+        if not files:
+            return f"No source files indexed under {root}"
+
+        def score(definition: dict, path: str) -> int:
+            name = definition["name"].rsplit(".", 1)[-1]
+            # Only count mentions from other files than the defining one
+            return references[name] - (1 if name in files[path]["references"] else 0)
+
+        ranked_files = []
+        for path, entry in files.items():
+            # depth 2 shows top-level definitions, 3 adds their members, and so on
+            definitions = [d for d in entry["definitions"] if d["depth"] < depth - 1]
+            file_score = sum(score(d, path) for d in entry["definitions"])
+            ranked_files.append((file_score, path, definitions))
+        ranked_files.sort(key=lambda item: (-item[0], item[1]))
+
+        lines = []
+        for file_score, path, definitions in ranked_files:
+            if len(lines) >= max_lines:
+                lines.append(f"... {len(ranked_files)} files in total; narrow the path or lower the depth")
+                break
+            lines.append(f"{os.path.relpath(path, root) if path != root else path}  (refs {file_score})")
+            if depth <= 1:
+                continue
+            for definition in definitions:
+                indent = "  " * (definition["depth"] + 1)
+                lines.append(f"{indent}L{definition['line']} {definition['signature']}")
+        return "\n".join(lines)
+
+    def find_symbol(self, name: str, root: Optional[str] = None, max_referencing_files: int = 10) -> str:
+        files = self._files_under(root) if root else dict(self._files)
+        short_name = name.rsplit(".", 1)[-1]
+        matches = []
+        for path, entry in files.items():
+            for definition in entry["definitions"]:
+                if definition["name"] == name or definition["name"].rsplit(".", 1)[-1] == name:
+                    matches.append((path, definition))
+        if not matches:
+            return f"No definition of {name} found"
+
+        lines = [f"{path}:{d['line']}  {d['signature']}  [{d['name']}]" for path, d in matches]
+        users = sorted(((entry["references"].get(short_name, 0), path) for path, entry in files.items()
+                        if entry["references"].get(short_name)), reverse=True)
+        if users:
+            lines.append(f"Referenced in {len(users)} files:")
+            lines.extend(f"  {path} ({count}x)" for count, path in users[:max_referencing_files])
+        return "\n".join(lines)
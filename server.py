@@ -0,0 +1,193 @@
+"""Multi-session HTTP server for the coding agent.
+
+All sessions share the loaded embedding model, the Chroma client and the file
+caches in tools.py. Each session keeps its own chat history and working
+directory, so sessions never see each other's `change_directory` calls.
+
+    python server.py --host 127.0.0.1 --port 8000
+
+Endpoints (JSON in, JSON out):
+    POST   /sessions                 {"directory": "..."} -> {"session_id", "directory"}
+    GET    /sessions                 -> {"sessions": [...]}
+    POST   /sessions/<id>/messages   {"message": "..."}   -> {"response", "directory", "tool_calls"}
+    DELETE /sessions/<id>
+    GET    /metrics                  -> counters and span timings, Prometheus text format
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import uuid
+from http import HTTPStatus
+
+import tools
+from agent import new_chat, run_turn
+from telemetry import metrics_text
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class Session:
+    """One user's chat history and workspace."""
+
+    def __init__(self, directory: str):
+        self.id = uuid.uuid4().hex
+        self.state = tools.WorkspaceState(directory)
+        self.chat = new_chat()
+        # A chat can only process one message at a time
+        self.lock = asyncio.Lock()
+
+    def handle_message(self, message: str):
+        """Run one agent turn; called in a worker thread."""
+        tools.activate_state(self.state)
+        tool_log = []
+        response = run_turn(self.chat, message, log=lambda line: tool_log.append(line.strip()))
+        return response, tool_log
+
+    def describe(self) -> dict:
+        return {"session_id": self.id, "directory": self.state.current_dir}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AgentServer:
+    def __init__(self):
+        self.sessions = {}
+
+    async def create_session(self, body: dict) -> dict:
+        directory = os.path.abspath(body.get("directory") or os.getcwd())
+        if not os.path.isdir(directory):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Directory {directory} does not exist")
+        session = Session(directory)
+        self.sessions[session.id] = session
+        if tools.WATCH_INDEX:
+            from watcher import shared_watcher
+            shared_watcher.watch(directory)
+        return session.describe()
+
+    def get_session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown session {session_id}")
+        return session
+
+    async def send_message(self, session_id: str, body: dict) -> dict:
+        session = self.get_session(session_id)
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Missing 'message'")
+        async with session.lock:
+            # asyncio.to_thread copies the context, so the session's state stays local to this call
+            response, tool_log = await asyncio.to_thread(session.handle_message, message)
+        result = session.describe()
+        result.update({"response": response, "tool_calls": tool_log})
+        return result
+
+    async def dispatch(self, method: str, path: str, body: dict):
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if parts == ["metrics"] and method == "GET":
+            return metrics_text()
+        if parts == ["sessions"]:
+            if method == "POST":
+                return await self.create_session(body)
+            if method == "GET":
+                return {"sessions": [s.describe() for s in self.sessions.values()]}
+        elif len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            self.get_session(parts[1])
+            del self.sessions[parts[1]]
+            return {"deleted": parts[1]}
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages" and method == "POST":
+            return await self.send_message(parts[1], body)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, payload = HTTPStatus.OK, {}
+            try:
+                method, path, body = await read_request(reader)
+                payload = await self.dispatch(method, path, body)
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+            except Exception as e:
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Error handling request: {e}"}
+            await write_response(writer, status, payload)
+        finally:
+            writer.close()
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Parse a minimal HTTP/1.1 request: request line, headers and a JSON body."""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+    body = {}
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except json.JSONDecodeError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid JSON body: {e}")
+    return method.upper(), path, body
+
+
+async def write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload):
+    """Send a JSON payload, or a plain text one such as the metrics dump."""
+    if isinstance(payload, str):
+        data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+    else:
+        data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + data)
+    await writer.drain()
+
+
+async def serve(host: str, port: int, workers: int):
+    loop = asyncio.get_running_loop()
+    # Tool calls and model requests block, so they run on a sized thread pool
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=workers))
+
+    # Load the embedding model and open the index once, before accepting sessions
+    print("Warming up embedding model and vector store...")
+    await asyncio.to_thread(tools.warm_up)
+
+    app = AgentServer()
+    server = await asyncio.start_server(app.handle_connection, host, port)
+    print(f"Agent server listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the coding agent to many concurrent sessions.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=16, help="Threads for tool and model calls")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Spans, timers and counters for the agent's hot paths.
+
+    with span("tool.read_file", path=path) as s:
+        ...
+        s.set(cache_hit=True)
+    increment("tokens_in", usage.prompt_token_count)
+
+Every finished span is timed into a per-name histogram and, when
+AGENT_TRACE_FILE is set, written as one JSON line with its trace id, parent
+span, duration and attributes. Spans nest through a ContextVar, so a tool call
+shows up under the model turn that asked for it, also across asyncio.to_thread.
+
+metrics_text() renders the counters and histograms in the Prometheus text
+format; the server exposes it on GET /metrics and AGENT_METRICS_FILE makes the
+CLI write it on exit.
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+TRACE_FILE = os.getenv("AGENT_TRACE_FILE")
+METRICS_FILE = os.getenv("AGENT_METRICS_FILE")
+METRIC_PREFIX = "agent"
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}    # name -> value
+_histograms = {}  # span name -> {"count", "sum", "max", "buckets"}
+_trace_handle = None
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        self.parent_id = parent.id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _record_span(self)
+        return False
+
+
+def span(name: str, **attributes) -> Span:
+    """Time a block of code as a named span; attributes go into the trace."""
+    return Span(name, attributes)
+
+
+def increment(name: str, value: float = 1):
+    if not value:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record_error(where: str, exc: BaseException):
+    """Count an exception that is handled (e.g. turned into an "Error ..." tool result) and tag the current span."""
+    increment(f"errors.{where}")
+    current = _current_span.get()
+    if current is not None:
+        current.set(handled_error=f"{type(exc).__name__}: {exc}")
+
+
+def _record_span(finished: Span):
+    with _lock:
+        histogram = _histograms.setdefault(
+            finished.name, {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)})
+        histogram["count"] += 1
+        histogram["sum"] += finished.duration
+        histogram["max"] = max(histogram["max"], finished.duration)
+        for i, bound in enumerate(BUCKETS):
+            if finished.duration <= bound:
+                histogram["buckets"][i] += 1
+        if "error" in finished.attributes:
+            _counters[f"errors.{finished.name}"] = _counters.get(f"errors.{finished.name}", 0) + 1
+        if TRACE_FILE:
+            _write_trace({
+                "trace_id": finished.trace_id, "span_id": finished.id, "parent_id": finished.parent_id,
+                "name": finished.name, "start": finished._wall_start, "duration_ms": finished.duration * 1000,
+                "thread": threading.current_thread().name, "attributes": finished.attributes,
+            })
+
+
+def _write_trace(record: dict):
+    """Append one span to the trace file; the caller holds _lock."""
+    global _trace_handle
+    if _trace_handle is None:
+        _trace_handle = open(TRACE_FILE, "a", encoding="utf-8")
+    _trace_handle.write(json.dumps(record, default=str) + "\n")
+    _trace_handle.flush()
+
+
+def _metric_name(name: str) -> str:
+    return f"{METRIC_PREFIX}_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def snapshot() -> dict:
+    """Copy of the current counters and span histograms."""
+    with _lock:
+        return {"counters": dict(_counters),
+                "spans": {name: dict(h, buckets=list(h["buckets"])) for name, h in _histograms.items()}}
+
+
+def metrics_text() -> str:
+    """Counters and span durations in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        metric = _metric_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+    if data["spans"]:
+        metric = f"{METRIC_PREFIX}_span_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for name, histogram in sorted(data["spans"].items()):
+            # Each span is counted in every bucket it fits, so counts are already cumulative
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f'{metric}_bucket{{span="{name}",le="{bound:g}"}} {count}')
+            lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{metric}_count{{span="{name}"}} {histogram["count"]}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_span_max_seconds gauge")
+        for name, histogram in sorted(data["spans"].items()):
+            lines.append(f'{METRIC_PREFIX}_span_max_seconds{{span="{name}"}} {histogram["max"]:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path: Optional[str] = METRICS_FILE):
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(metrics_text())
+
+
+if METRICS_FILE:
+    atexit.register(dump_metrics)
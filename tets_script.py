@@ -5,7 +5,9 @@
 
 import os
 import sys
+import tempfile
 import traceback
+import zlib
 from tools import (
     initialize_vectorstore,
     change_directory,
@@ -33,6 +35,248 @@ def safe_test(func_name, func, *args, **kwargs):
         print(f"traceback: {traceback.format_exc()}")
         return False
 
+class HashingEmbeddingFunction:
+    """Small deterministic bag-of-words embedding so backend checks don't need the Jina model."""
+
+    def __init__(self, dim=64):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = [0.0] * self.dim
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % self.dim] += 1.0
+            vectors.append(vector)
+        return vectors
+
+def check_vector_store(backend):
+    """Run the same add/query/replace/delete/reopen checks against one vector store backend."""
+    from vectorstore import open_store
+    embedding_function = HashingEmbeddingFunction()
+    with tempfile.TemporaryDirectory() as path:
+        def open_backend():
+            client = None
+            if backend == "chroma":
+                import chromadb
+                client = chromadb.PersistentClient(path=path)
+            return open_store(backend, embedding_function, chroma_client=client, path=path)
+
+        store = open_backend()
+        assert store.count() == 0, "new store should be empty"
+        store.add(
+            ["a.py_chunk_0", "a.py_chunk_1", "b.py_chunk_0"],
+            ["parse the config file", "retry the http request", "render the html template"],
+            [{"source": "a.py", "chunk": 0}, {"source": "a.py", "chunk": 1}, {"source": "b.py", "chunk": 0}]
+        )
+        assert store.count() == 3, f"expected 3 vectors, got {store.count()}"
+        hits = store.query("retry the http request", k=2)
+        assert hits[0]["id"] == "a.py_chunk_1", f"wrong top hit {hits[0]['id']}"
+        assert hits[0]["metadata"]["source"] == "a.py"
+        assert hits[0]["document"] == "retry the http request"
+
+        # Re-adding an id replaces the old document
+        store.add(["b.py_chunk_0"], ["compile the sql query"], [{"source": "b.py", "chunk": 0}])
+        assert store.count() == 3, "replacing an id should not grow the store"
+        assert store.query("compile the sql query", k=1)[0]["document"] == "compile the sql query"
+
+        # Old chunks of a re-ingested file are dropped after the new ones are written
+        store.add(["a.py@r2_chunk_0"], ["parse the yaml file"], [{"source": "a.py", "chunk": 0}])
+        store.delete("a.py", keep_ids=["a.py@r2_chunk_0"])
+        assert store.count() == 2, "delete should keep the listed ids"
+        store.delete_ids(["a.py@r2_chunk_0", "missing"])
+        assert store.count() == 1, "delete_ids should drop the listed ids"
+        store.add(["a.py_chunk_0"], ["parse the config file"], [{"source": "a.py", "chunk": 0}])
+
+        store.delete("a.py")
+        assert store.count() == 1, "delete should drop every chunk of the source"
+        assert [hit["id"] for hit in store.query("parse the config file", k=3)] == ["b.py_chunk_0"]
+
+        # Data survives closing and reopening the store
+        del store
+        reopened = open_backend()
+        assert reopened.count() == 1, "store should persist across reopen"
+        assert reopened.query("compile the sql query", k=1)[0]["id"] == "b.py_chunk_0"
+    return f"{backend} backend passed"
+
+def check_index_migration(backend="numpy"):
+    """A new embedding dimension is re-embedded in the background while the old index keeps answering."""
+    import json
+    import threading
+    from index_versions import DirectoryVersions, VersionedStore
+    files = {"a.py": "parse the config file", "b.py": "retry the http request", "c.py": "render the html template"}
+    functions = {64: HashingEmbeddingFunction(64), 32: HashingEmbeddingFunction(32)}
+    resume = threading.Event()
+
+    def ingest(path, store):
+        resume.wait(10)
+        store.delete(path)
+        store.add([f"{path}_chunk_0"], [files[path]], [{"source": path, "chunk": 0}])
+
+    with tempfile.TemporaryDirectory() as path:
+        def open_versioned(dim):
+            spec = {"embedding": {"function": "hashing", "dim": dim}}
+            storage = DirectoryVersions(backend, path)
+            return VersionedStore(path, spec, storage, lambda s: functions[s["embedding"]["dim"]],
+                                  lambda: sorted(files), ingest)
+
+        resume.set()
+        store = open_versioned(64)
+        for name in files:
+            ingest(name, store)
+        assert store.count() == 3 and store.status()["building"] is None
+
+        # Changing the dimension starts a rebuild; queries keep using the 64-dim version
+        resume.clear()
+        old_tag = store.active_tag
+        store = open_versioned(32)
+        assert store.status()["building"] == store.tag and store.active_tag == old_tag
+        assert store.query("retry the http request", k=1)[0]["id"] == "b.py_chunk_0"
+        # Writes during the rebuild reach both versions
+        files["d.py"] = "compile the sql query"
+        store.add(["d.py_chunk_0"], [files["d.py"]], [{"source": "d.py", "chunk": 0}])
+        assert store.count() == 4
+        resume.set()
+        assert store.wait(30), "rebuild did not finish"
+
+        with open(os.path.join(path, "registry.json")) as f:
+            registry = json.load(f)
+        assert registry["active"] == store.tag and registry["previous"] == old_tag, registry
+        assert store.active_tag == store.tag and store.count() == 4
+        assert store.query("compile the sql query", k=1)[0]["id"] == "d.py_chunk_0"
+        # Reopening with the same config serves the new version without rebuilding
+        reopened = open_versioned(32)
+        assert reopened.status()["building"] is None and reopened.count() == 4
+
+    # A store from before versioning is re-embedded from its own sources, and
+    # stays active when one of its files fails
+    from vectorstore import open_store
+    with tempfile.TemporaryDirectory() as path:
+        source = os.path.join(path, "e.py")
+        with open(source, "w") as f:
+            f.write("close the socket")
+        open_store(backend, functions[64], path=path).add(
+            [f"{source}_chunk_0"], ["close the socket"], [{"source": source, "chunk": 0}])
+        broken = {"e.py": True}
+
+        corrupt = os.path.join(path, "corrupt.pdf")
+
+        def ingest_file(file_path, store):
+            if file_path == corrupt or broken["e.py"]:
+                raise OSError("extractor failed")
+            with open(file_path) as f:
+                store.add([f"{file_path}_chunk_0"], [f.read()], [{"source": file_path, "chunk": 0}])
+
+        def open_legacy():
+            spec = {"embedding": {"function": "hashing", "dim": 32}}
+            return VersionedStore(path, spec, DirectoryVersions(backend, path), lambda s: functions[s["embedding"]["dim"]],
+                                  lambda: [corrupt], ingest_file, legacy_spec={"embedding": {"function": "hashing", "dim": 64}},
+                                  background=False)
+
+        store = open_legacy()
+        with open(os.path.join(path, "registry.json")) as f:
+            registry = json.load(f)
+        assert store.active_tag == "legacy" and registry["versions"][store.tag]["status"] == "failed", registry
+        # A file the old version never held (it failed there as well) does not block the cutover
+        broken["e.py"] = False
+        store = open_legacy()
+        assert store.active_tag == store.tag and store.count() == 1
+        assert os.path.exists(os.path.join(path, "config.json")), "the legacy store must not be deleted"
+    return f"{backend} migration passed"
+
+def check_document_ingestion():
+    """Documents are extracted one page or cell at a time, with their numbers kept."""
+    from ingestion import iter_sections
+    here = os.path.dirname(os.path.abspath(__file__))
+    pages = [section.metadata["page"] for section in iter_sections(os.path.join(here, "test_resources", "2509.19341v1.pdf"))]
+    assert pages and pages == sorted(pages), f"expected increasing page numbers, got {pages}"
+    cells = list(iter_sections(os.path.join(here, "Late_Chunking_in_Long_Context_Embedding_Models.ipynb")))
+    assert cells and all(section.text.strip() and "cell" in section.metadata for section in cells)
+    return f"{len(pages)} PDF pages, {len(cells)} notebook cells"
+
+def check_context_packing():
+    """An oversized top hit is cut to fit, and one that cannot fit does not hide the smaller hits."""
+    from context_packer import pack
+    count = lambda text: len(text) // 4 + 1
+    minified = {"document": "var a=1;" * 200, "score": 0.9, "metadata": {"source": "app.min.js", "start_line": 1, "end_line": 1}}
+    small = {"document": "def retry():\n    return 1\n", "score": 0.5,
+             "metadata": {"source": "b.py", "start_line": 3, "end_line": 4}}
+    spans = pack([minified, small], token_budget=100, count_tokens=count)
+    assert spans and spans[0].source == "app.min.js", "the single-line top hit should be cut down, not dropped"
+    assert sum(count(span.render(i + 1)) for i, span in enumerate(spans)) <= 100
+    assert minified["document"].startswith(spans[0].text) and len(spans[0].text) < len(minified["document"])
+    # Not even the header of this hit fits; the lower hit is still returned
+    unfit = dict(minified, metadata=dict(minified["metadata"], source="x" * 600))
+    spans = pack([unfit, small], token_budget=100, count_tokens=count)
+    assert [span.source for span in spans] == ["b.py"], [span.source for span in spans]
+    return f"{len(spans)} span packed"
+
+def check_chunker():
+    """Chunks of Python, JavaScript and Markdown reassemble into the original file, line for line."""
+    from code_chunker import chunk_code
+    here = os.path.dirname(os.path.abspath(__file__))
+    javascript = "".join(f"function f{i}(a) {{\n  if (a) {{\n    return a + {i};\n  }}\n}}\n\n" for i in range(40))
+    samples = {"tools.py": open(os.path.join(here, "tools.py")).read(),
+               "README.md": open(os.path.join(here, "README.md")).read(), "app.js": javascript}
+    total = 0
+    for name, source in samples.items():
+        chunks = chunk_code(source, name, max_tokens=200)
+        lines = source.splitlines(keepends=True)
+        assert "".join(c["text"] for c in chunks) == source, f"{name}: chunks do not reassemble"
+        for c in chunks:
+            assert c["text"] == "".join(lines[c["start_line"] - 1:c["end_line"]]), f"{name}: wrong line range {c['start_line']}"
+        assert len(chunks) > 1, f"{name} should be split"
+        total += len(chunks)
+    return f"{total} chunks reassembled"
+
+def check_repo_map():
+    """repo_map and find_symbol follow definitions, and forget files deleted from disk."""
+    from repo_map import SymbolIndex
+    from tools import is_indexable, skip_directory
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, "a.py"), "w") as f:
+            f.write("from b import bar\n\n\ndef foo():\n    return bar()\n")
+        with open(os.path.join(root, "b.py"), "w") as f:
+            f.write("def bar():\n    return 1\n")
+        index = SymbolIndex(None)
+        index.update_tree(root, is_indexable, skip_directory)
+        assert "b.py" in index.find_symbol("bar", root=root) and "def foo()" in index.repo_map(root)
+        os.remove(os.path.join(root, "b.py"))
+        index.update_tree(root, is_indexable, skip_directory)
+        assert "b.py" not in index.repo_map(root), "a deleted file should leave the repo map"
+        assert "b.py" not in index.find_symbol("bar", root=root)
+    return "repo map passed"
+
+def check_output_capping():
+    """Tool outputs of a turn are fitted into the context window before they are sent."""
+    import agent
+    from google.generativeai import protos
+    from model_client import ScriptedClient
+
+    def response(text):
+        return protos.Content(role="user", parts=[protos.Part(function_response=protos.FunctionResponse(
+            name="read_file", response={"result": text}))])
+    call = protos.Content(role="model", parts=[protos.Part(function_call=protos.FunctionCall(name="read_file", args={}))])
+    # The small profile's window keeps the check fast whatever model is configured
+    window = 8192
+    chat = type("Chat", (), {})()
+    chat.history = [protos.Content(role="user", parts=[protos.Part(text="old question")]), call,
+                    response("[context aaa]\n" + "old " * window), protos.Content(role="model", parts=[protos.Part(text="answer")]),
+                    protos.Content(role="user", parts=[protos.Part(text="new question")]), call,
+                    response("[context bbb]\n" + "earlier " * (window // 3)), call]
+    results = [("read_file", "[context ccc]\n" + "new " * window * 2)]
+    saved = agent.model_client, agent.CONTEXT_WINDOW, agent.REPLY_RESERVE_TOKENS
+    agent.model_client, agent.CONTEXT_WINDOW, agent.REPLY_RESERVE_TOKENS = ScriptedClient(latency=0, jitter=0), window, window // 8
+    try:
+        fitted = agent._fit_to_window(chat, results, {"prompt": agent._history_tokens(chat), "last_output": 10}, lambda message: None)
+    finally:
+        agent.model_client, agent.CONTEXT_WINDOW, agent.REPLY_RESERVE_TOKENS = saved
+    limit = window - window // 8
+    total = agent._history_tokens(chat) + sum(agent.count_tokens(result) for _, result in fitted)
+    assert total <= limit, f"{total} tokens do not fit in {limit}"
+    assert "get_context('ccc'" in fitted[0][1], "a cut output should say how to read the rest"
+    return f"{total} of {limit} tokens used"
+
 def main():
     print("starting  testing of all tools.py functions")
 
@@ -119,6 +363,17 @@ def main():
         print(f"{'-'*10}")
         test_results['search_vectorstore'] = False
 
+    # 8b. PDFs and notebooks are streamed by page / cell
+    test_results['document_ingestion'] = safe_test(
+        'document_ingestion',
+        check_document_ingestion
+    )
+    test_results['add_to_vectorstore[pdf]'] = safe_test(
+        'add_to_vectorstore[pdf]',
+        add_to_vectorstore,
+        os.path.join("test_resources", "2509.19341v1.pdf")
+    )
+
     # 9. Test index_codebase (might be problematic too)
     # We'll test it with a small directory to avoid processing too much
     test_results['index_codebase'] = safe_test(
@@ -127,6 +382,26 @@ def main():
         "."  # Current directory
     )
 
+    # 10. Same contract checks for every vector store backend, so they can be A/B tested
+    backends = os.getenv("VECTOR_STORE_BACKENDS", "chroma,numpy,compact").split(",")
+    for backend in backends:
+        test_results[f'vector_store[{backend}]'] = safe_test(
+            f'vector_store[{backend}]',
+            check_vector_store,
+            backend
+        )
+
+    # 11. Model or chunker changes migrate the index without dropping it
+    test_results['index_migration'] = safe_test(
+        'index_migration',
+        check_index_migration
+    )
+
+    # 12. Retrieval packing, chunking, repo map and in-turn output capping
+    for name, check in (('context_packing', check_context_packing), ('chunker', check_chunker),
+                        ('repo_map', check_repo_map), ('output_capping', check_output_capping)):
+        test_results[name] = safe_test(name, check)
+
     # Summary
     print(f"\n{'='*60}")
     print("summary of test results")
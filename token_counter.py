@@ -0,0 +1,49 @@
+"""Token counting for the chat model.
+
+Gemini models are counted with the local tokenizer shipped in the Vertex AI
+SDK (`pip install "google-cloud-aiplatform[tokenization]"`), so budgets match
+what the API bills without a network round trip. Without it, or for models
+it doesn't know, we fall back to a character-based estimate.
+"""
+import os
+import threading
+
+DEFAULT_MODEL = os.getenv("AGENT_MODEL", "gemini-2.5-flash")
+
+_tokenizers = {}
+_lock = threading.Lock()
+
+
+def _approximate(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _load_tokenizer(model_name: str):
+    try:
+        from vertexai.preview.tokenization import get_tokenizer_for_model
+        return get_tokenizer_for_model(model_name)
+    except Exception:
+        # SDK missing or model unknown to it
+        return None
+
+
+def get_tokenizer(model_name: str = DEFAULT_MODEL):
+    with _lock:
+        if model_name not in _tokenizers:
+            _tokenizers[model_name] = _load_tokenizer(model_name)
+        return _tokenizers[model_name]
+
+
+def count_tokens(text: str, model_name: str = DEFAULT_MODEL) -> int:
+    """Number of tokens `text` costs in the given model's context window."""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer(model_name)
+    if tokenizer is None:
+        return _approximate(text)
+    return tokenizer.count_tokens(text).total_tokens
+
+
+def is_exact(model_name: str = DEFAULT_MODEL) -> bool:
+    """Whether counts come from the model's real tokenizer rather than an estimate."""
+    return get_tokenizer(model_name) is not None
@@ -1,11 +1,22 @@
 import os
+import json
 import subprocess
+import threading
+import contextvars
+import uuid
 from typing import Optional, List
 import chromadb
 # LangChain imports removed - using direct ChromaDB now
 # from langchain_chroma import Chroma
 # from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from code_chunker import CHUNKER_VERSION, chunk_code
+from repo_map import SymbolIndex
+from context_packer import pack, format_spans
+from profiles import active_profile
+from embedding_backends import EMBEDDING_BACKEND, EmbeddingBackend, get_backend
+from ingestion import Section, iter_sections, is_binary_document, read_document
+from telemetry import span, increment, record_error
+from index_versions import ChromaVersions, DirectoryVersions, VersionedStore
 try:
     from late_chunking_utils import get_late_chunking_embeddings
 except ImportError as e:
@@ -13,24 +24,239 @@ except ImportError as e:
     def get_late_chunking_embeddings(text):
         return None
 
-current_dir = os.getcwd()
+class WorkspaceState:
+    """Mutable per-session state used by the tool functions."""
+
+    def __init__(self, current_dir: str):
+        self.current_dir = current_dir
+
+# Each chat session activates its own WorkspaceState; the CLI just uses the default one
+_default_state = WorkspaceState(os.getcwd())
+_state = contextvars.ContextVar("workspace_state", default=_default_state)
+
+def activate_state(state: WorkspaceState):
+    """Make `state` the workspace used by tool calls in the current context."""
+    return _state.set(state)
+
+def get_current_dir() -> str:
+    """Return the working directory of the active session."""
+    return _state.get().current_dir
 
 def _resolve_path(path: str) -> str:
     """Resolve a path against the agent's current working directory."""
-    return os.path.abspath(os.path.join(current_dir, path))
+    return os.path.abspath(os.path.join(get_current_dir(), path))
 
-# Caches
+# Caches (shared by all sessions, keyed by absolute path and mtime)
 file_cache = {}
 dir_cache = {}
 
+# Shared Chroma client and embedding function, created once per process
+CHROMA_PATH = "./chroma_db"
+EMBEDDING_MODEL = "jinaai/jina-embeddings-v2-base-en"
+_client = None
+_embedding_function = None
+_store_lock = threading.Lock()
+
+def _get_client():
+    """Return the process-wide Chroma client, opening the store on first use."""
+    global _client
+    with _store_lock:
+        if _client is None:
+            _client = chromadb.PersistentClient(path=os.path.abspath(CHROMA_PATH))
+        return _client
+
+def _get_embedding_function():
+    """Return the process-wide Jina embedding function, loading the model on first use."""
+    global _embedding_function
+    with _store_lock:
+        if _embedding_function is None:
+            # EMBEDDING_BACKEND picks PyTorch or ONNX inference (see embedding_backends.py)
+            _embedding_function = get_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+        return _embedding_function
+
+# Vector store backend: "chroma" (default), "numpy" or "compact" (see vectorstore.py)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", f"./{VECTOR_STORE}_db")
+COMPACT_TRUNCATE_DIM = os.getenv("COMPACT_TRUNCATE_DIM")
+# Measure recall against exact search after index_codebase; it scans a sample of the float32 vectors
+COMPACT_RECALL_CHECK = os.getenv("COMPACT_RECALL_CHECK", "0") == "1"
+_vector_store = None
+# Model, chunker and store settings of the index version this process writes
+_current_spec = None
+
+def _embedding_spec(embedding_function) -> dict:
+    """What produced the vectors: model, revision and backend, and the vector dimension."""
+    if isinstance(embedding_function, EmbeddingBackend):
+        spec = {"model": embedding_function.model_name, "revision": embedding_function.revision,
+                "backend": embedding_function.name}
+    else:
+        # A custom embedding function, e.g. the hashing one used in tests and benchmarks
+        spec = {"function": type(embedding_function).__name__}
+    spec["dim"] = len(embedding_function(["dimension probe"])[0])
+    return spec
+
+def _store_options() -> dict:
+    options = {}
+    if VECTOR_STORE == "compact" and COMPACT_TRUNCATE_DIM:
+        options["truncate_dim"] = int(COMPACT_TRUNCATE_DIM)
+    return options
+
+def _embedding_function_for(spec: dict):
+    """The embedding function an index version was built with, so its queries stay comparable."""
+    if spec["embedding"] == _current_spec["embedding"]:
+        # Already loaded by _get_store (which holds _store_lock while this runs)
+        return _embedding_function
+    if "backend" not in spec["embedding"]:
+        raise ValueError(f"Cannot load embedding function {spec['embedding']} of index version")
+    embedding = spec["embedding"]
+    return get_backend(embedding["backend"], embedding["model"], embedding["revision"])
+
+def _get_store():
+    """Return the process-wide vector store for the configured backend, opening it on first use.
+
+    The store is versioned (see index_versions.py): if the model, chunker or store
+    settings changed since the index was built, the old index keeps serving
+    queries while a new one is re-embedded in the background.
+    """
+    global _vector_store, _current_spec
+    if _vector_store is None:
+        embedding_function = _get_embedding_function()
+        client = _get_client() if VECTOR_STORE == "chroma" else None
+        with _store_lock:
+            if _vector_store is None:
+                options = _store_options()
+                _current_spec = {
+                    "embedding": _embedding_spec(embedding_function),
+                    "chunker": {"version": CHUNKER_VERSION, "max_tokens": CHUNK_TOKENS},
+                    "store": {"backend": VECTOR_STORE, **options},
+                }
+                if VECTOR_STORE == "chroma":
+                    storage = ChromaVersions(client)
+                else:
+                    storage = DirectoryVersions(VECTOR_STORE, os.path.abspath(VECTOR_STORE_PATH), **options)
+                # A pre-versioning index is assumed to come from the current model
+                legacy_spec = dict(_current_spec, legacy=True)
+                _vector_store = VersionedStore(
+                    os.path.dirname(_indexed_paths_file()), _current_spec, storage, _embedding_function_for,
+                    _indexed_files, _ingest, legacy_spec=legacy_spec,
+                )
+    return _vector_store
+
+def warm_up():
+    """Load the embedding model and open the vector store ahead of the first request."""
+    _get_store()
+
+# Keep the index fresh by watching the agent's working directories (see watcher.py)
+WATCH_INDEX = os.getenv("WATCH_INDEX", "1") == "1"
+
+# Files picked up by index_codebase and kept fresh by the index watcher
+# (.pdf and .ipynb go through the extractors in ingestion.py)
+CODE_EXTENSIONS = {'.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', '.md', '.txt', '.json', '.yaml', '.yml',
+                   '.pdf', '.ipynb'}
+SKIP_DIRS = {'node_modules', '__pycache__', 'venv', 'env'}
+
+def skip_directory(name: str) -> bool:
+    return name.startswith('.') or name in SKIP_DIRS
+
+def _store_dirs() -> set:
+    return {os.path.abspath(CHROMA_PATH), os.path.abspath(VECTOR_STORE_PATH)}
+
+def is_indexable(path: str) -> bool:
+    """Whether index_codebase would pick up this file."""
+    parts = os.path.normpath(path).split(os.sep)
+    if any(path.startswith(d + os.sep) for d in _store_dirs()):
+        # Never index the vector store's own files
+        return False
+    return any(path.endswith(ext) for ext in CODE_EXTENSIONS) and not any(skip_directory(p) for p in parts[:-1] if p)
+
+# Directories and files that are in the index, persisted next to the store
+_indexed_paths = None
+
+def _indexed_paths_file() -> str:
+    store_dir = CHROMA_PATH if VECTOR_STORE == "chroma" else VECTOR_STORE_PATH
+    return os.path.join(os.path.abspath(store_dir), "indexed_paths.json")
+
+def get_indexed_paths() -> set:
+    global _indexed_paths
+    with _store_lock:
+        if _indexed_paths is None:
+            try:
+                with open(_indexed_paths_file()) as f:
+                    _indexed_paths = set(json.load(f))
+            except (OSError, ValueError):
+                _indexed_paths = set()
+        return _indexed_paths
+
+def _covered(path: str, paths: set) -> bool:
+    """Whether path or one of its parent directories is in paths."""
+    while path not in paths:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return True
+
+def _remember_indexed(path: str):
+    paths = get_indexed_paths()
+    if _covered(path, paths):
+        return
+    with _store_lock:
+        # Entries under a newly added directory are covered by it now
+        paths -= {p for p in paths if p.startswith(path + os.sep)}
+        paths.add(path)
+        os.makedirs(os.path.dirname(_indexed_paths_file()), exist_ok=True)
+        with open(_indexed_paths_file(), "w") as f:
+            json.dump(sorted(paths), f)
+
+def _forget_indexed(directory: str):
+    """Drop a directory and everything under it from the indexed paths."""
+    paths = get_indexed_paths()
+    with _store_lock:
+        gone = {p for p in paths if p == directory or p.startswith(directory + os.sep)}
+        if not gone:
+            return
+        paths -= gone
+        with open(_indexed_paths_file(), "w") as f:
+            json.dump(sorted(paths), f)
+
+def has_indexed_under(directory: str) -> bool:
+    """Whether the directory or anything below it was added to the index."""
+    return is_indexed(directory) or any(p.startswith(directory + os.sep) for p in get_indexed_paths())
+
+_symbol_index = None
+
+def get_symbol_index() -> SymbolIndex:
+    """Return the process-wide symbol index behind repo_map and find_symbol."""
+    global _symbol_index
+    with _store_lock:
+        if _symbol_index is None:
+            _symbol_index = SymbolIndex(os.path.join(os.path.dirname(_indexed_paths_file()), "symbols.json"))
+        return _symbol_index
+
+# Bumped on every index write, so cached search results can tell they are stale
+_index_generation = 0
+
+def index_generation() -> int:
+    return _index_generation
+
+def _index_changed():
+    global _index_generation
+    _index_generation += 1
+
+def is_indexed(path: str) -> bool:
+    """Whether the file is covered by an earlier add_to_vectorstore or index_codebase call."""
+    return _covered(path, get_indexed_paths())
+
 # Global variables for legacy compatibility (no longer used)
 # embeddings = None
 # vectorstore = None
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    separators=["\n\n", "\n", " ", ""]
-)
+
+# Token budget per chunk; chunks follow syntactic units (see code_chunker.py)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", str(active_profile.chunk_tokens)))
+# Candidates fetched per requested result when packing search results into a token budget
+RETRIEVAL_OVERFETCH = 3
+# Chunks embedded and written per store.add call while streaming a document
+INGEST_BATCH_CHUNKS = 64
 
 def initialize_vectorstore():
     """Initialize vector database components on first use. (Legacy function - now ChromaDB is used directly)"""
@@ -40,11 +266,14 @@ def initialize_vectorstore():
 
 def change_directory(path: str) -> str:
     """Change the current working directory for subsequent operations."""
-    global current_dir
+    state = _state.get()
     full_path = _resolve_path(path)
     if os.path.isdir(full_path):
-        current_dir = full_path
-        return f"Changed directory to {current_dir}"
+        state.current_dir = full_path
+        if WATCH_INDEX:
+            from watcher import shared_watcher
+            shared_watcher.watch(full_path)
+        return f"Changed directory to {state.current_dir}"
     else:
         return f"Directory {full_path} does not exist"
 
@@ -55,17 +284,24 @@ def read_file(file_path: str) -> str:
         mtime = os.path.getmtime(resolved_path)
         key = (resolved_path, mtime)
         if key in file_cache:
+            increment("file_cache_hits")
             return file_cache[key]
-        with open(resolved_path, 'r') as f:
-            content = f.read()
+        increment("file_cache_misses")
+        increment("bytes_read", os.path.getsize(resolved_path))
+        if is_binary_document(resolved_path):
+            content = read_document(resolved_path)
+        else:
+            with open(resolved_path, 'r') as f:
+                content = f.read()
         file_cache[key] = content
         return content
     except Exception as e:
+        record_error("read_file", e)
         return f"Error reading file: {e}"
 
 def search_code(pattern: str, path: Optional[str] = None) -> str:
     """Search for a regex pattern in files within a given path (relative or absolute)."""
-    search_path = _resolve_path(path) if path is not None else current_dir
+    search_path = _resolve_path(path) if path is not None else get_current_dir()
     if not os.path.isdir(search_path):
         return f"Error: The path {search_path} is not a valid directory."
     try:
@@ -76,7 +312,7 @@ def search_code(pattern: str, path: Optional[str] = None) -> str:
 
 def list_directory(path: Optional[str] = None) -> str:
     """List files and directories in a given path (relative or absolute)."""
-    list_path = _resolve_path(path) if path is not None else current_dir
+    list_path = _resolve_path(path) if path is not None else get_current_dir()
     if not os.path.isdir(list_path):
         return f"Error: The path {list_path} is not a valid directory."
     try:
@@ -94,139 +330,221 @@ def run_command(command: str) -> str:
     """Run a bash command and return the output."""
     try:
         # Execute in the current directory
-        full_command = f"cd '{current_dir}' && {command}"
+        full_command = f"cd '{get_current_dir()}' && {command}"
         result = subprocess.run(full_command, shell=True, capture_output=True, text=True)
         return result.stdout + result.stderr
     except Exception as e:
         return f"Error running command: {e}"
 
-def add_to_vectorstore(file_path: str, content: str = None) -> str:
-    """Add a file's content to the vector database for semantic search."""
-    resolved_path = _resolve_path(file_path)
-    try:
-        # Use ChromaDB client with consistent Jina embeddings
-        client = chromadb.PersistentClient(path="./chroma_db")
+def _add_chunks(store, ids: List[str], chunks: List[str], metadatas: List[dict]):
+    """Embed and write one batch of chunks (the store runs the embedding model)."""
+    with span("store.add", backend=VECTOR_STORE, chunks=len(chunks)):
+        store.add(ids, chunks, metadatas)
+    increment("chunks_embedded", len(chunks))
 
-        # Use same embedding function as chroma.py for consistency
-        from chromadb.utils import embedding_functions
-        jina_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="jinaai/jina-embeddings-v2-base-en"
-        )
+def _ingest(resolved_path: str, store, content: str = None) -> int:
+    """Replace a file's chunks in the store; return how many were added.
 
-        # Try to get existing collection, if dimension mismatch, create new one
-        try:
-            collection = client.get_collection(name="codebase")
-        except Exception:
-            # Collection doesn't exist or has issues, create new one
-            try:
-                client.delete_collection(name="codebase")
-            except Exception:
-                pass  # Collection might not exist
-            collection = client.create_collection(
-                name="codebase",
-                embedding_function=jina_ef
-            )
+    The new chunks get ids of their own and the old ones are only dropped once
+    the whole file went in. If an extractor or the store fails partway, the
+    chunks written so far are removed and the previous version stays indexed.
+    """
+    if content is not None:
+        sections = [Section(content, chunk_as=resolved_path)]
+    else:
+        sections = iter_sections(resolved_path)
 
-        if content is None:
-            content = read_file(resolved_path)
+    revision = uuid.uuid4().hex[:8]
+    written, ids, chunks, metadatas = [], [], [], []
+    total = 0
+    try:
+        for section in sections:
+            increment("bytes_read", len(section.text.encode("utf-8")))
+            # Split each section into syntactic chunks
+            with span("index.chunk", path=resolved_path, **section.metadata):
+                code_chunks = chunk_code(section.text, section.chunk_as, max_tokens=CHUNK_TOKENS)
+            for c in code_chunks:
+                ids.append(f"{resolved_path}@{revision}_chunk_{total}")
+                chunks.append(c["text"])
+                metadatas.append({"source": resolved_path, "chunk": total, "symbol": c["symbol"],
+                                  "start_line": c["start_line"] + section.start_line - 1,
+                                  "end_line": c["end_line"] + section.start_line - 1,
+                                  **section.metadata})
+                total += 1
+            if len(chunks) >= INGEST_BATCH_CHUNKS:
+                written.extend(ids)
+                _add_chunks(store, ids, chunks, metadatas)
+                ids, chunks, metadatas = [], [], []
+        if chunks:
+            written.extend(ids)
+            _add_chunks(store, ids, chunks, metadatas)
+    except BaseException:
+        with span("store.delete", backend=VECTOR_STORE, rollback=True):
+            store.delete_ids(written)
+        raise
 
-        if content.startswith("Error"):
-            return content
+    # Drop chunks of the earlier version of the file
+    with span("store.delete", backend=VECTOR_STORE):
+        store.delete(resolved_path, keep_ids=written)
+    return total
 
-        # Split content into chunks
-        chunks = text_splitter.split_text(content)
+def _walk_indexable(directory: str):
+    """Yield the files under directory that index_codebase picks up."""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not skip_directory(d) and os.path.join(root, d) not in _store_dirs()]
+        for file in files:
+            if any(file.endswith(ext) for ext in CODE_EXTENSIONS):
+                yield os.path.join(root, file)
 
-        # Creating metadata for each chunk
-        metadatas = [{"source": resolved_path, "chunk": i} for i in range(len(chunks))]
-        ids = [f"{resolved_path}_chunk_{i}" for i in range(len(chunks))]
+def _indexed_files():
+    """Every file currently covered by the index, for re-embedding into a new index version."""
+    for path in sorted(get_indexed_paths()):
+        if os.path.isdir(path):
+            yield from _walk_indexable(path)
+        elif os.path.isfile(path):
+            yield path
 
-        # Add to ChromaDB collection - let ChromaDB handle embeddings automatically
+def add_to_vectorstore(file_path: str, content: str = None) -> str:
+    """Add a file's content to the vector database for semantic search.
+
+    Without `content` the file is streamed page by page or section by section
+    (see ingestion.py), so only one section is in memory at a time.
+    """
+    resolved_path = _resolve_path(file_path)
+    with span("index.add_file", path=resolved_path):
         try:
-            collection.add(
-                documents=chunks,
-                metadatas=metadatas,
-                ids=ids
-            )
+            if content is not None and content.startswith("Error"):
+                return content
+            store = _get_store()
+            # Keep a background re-embed from interleaving with this file's writes
+            with store.write_lock:
+                total = _ingest(resolved_path, store, content)
+            _remember_indexed(resolved_path)
+            get_symbol_index().update_file(resolved_path, content)
+            _index_changed()
+
+            return f"Added {total} chunks from {resolved_path} to vector database"
         except Exception as e:
-            if "dimension" in str(e).lower() or "already exists" in str(e).lower():
-                # Dimension mismatch or ID conflict - recreate collection
-                try:
-                    client.delete_collection(name="codebase")
-                    collection = client.create_collection(
-                        name="codebase",
-                        embedding_function=jina_ef
-                    )
-                    collection.add(
-                        documents=chunks,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
-                except Exception as inner_e:
-                    return f"Error recreating collection: {inner_e}"
-            else:
-                raise e
+            record_error("add_to_vectorstore", e)
+            return f"Error adding to vectorstore: {e}"
 
-        return f"Added {len(chunks)} chunks from {resolved_path} to vector database"
+def remove_from_vectorstore(file_path: str) -> str:
+    """Remove every chunk of a file from the vector database."""
+    resolved_path = _resolve_path(file_path)
+    try:
+        _get_store().delete(resolved_path)
+        get_symbol_index().remove_file(resolved_path)
+        _index_changed()
+        return f"Removed {resolved_path} from vector database"
     except Exception as e:
-        return f"Error adding to vectorstore: {e}"
+        return f"Error removing from vectorstore: {e}"
 
-def search_vectorstore(query: str, k: int = 5) -> str:
-    """Search the vector database for semantically similar content."""
+def remove_tree_from_vectorstore(directory: str) -> str:
+    """Remove every indexed file under a directory that was deleted or moved away."""
+    resolved_path = _resolve_path(directory)
+    prefix = resolved_path + os.sep
     try:
-        # Use ChromaDB client with consistent Jina embeddings
-        client = chromadb.PersistentClient(path="./chroma_db")
+        store = _get_store()
+        removed = sorted(source for source in store.sources() if source and source.startswith(prefix))
+        for source in removed:
+            store.delete(source)
+            get_symbol_index().remove_file(source)
+        _forget_indexed(resolved_path)
+        _index_changed()
+        return f"Removed {len(removed)} files under {resolved_path} from vector database"
+    except Exception as e:
+        record_error("remove_tree_from_vectorstore", e)
+        return f"Error removing from vectorstore: {e}"
 
-        # Use same embedding function as add_to_vectorstore
-        from chromadb.utils import embedding_functions
-        jina_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="jinaai/jina-embeddings-v2-base-en"
-        )
+def search_vectorstore(query: str, k: Optional[int] = None, token_budget: Optional[int] = None) -> str:
+    """Search the vector database for semantically similar content.
 
-        try:
-            collection = client.get_collection(name="codebase")
-        except Exception:
-            # Collection doesn't exist
+    Neighbouring chunks of a file are merged and near-duplicates dropped. With a
+    token_budget, results are filled by score until the budget is spent.
+    Without one, at most k results within the active profile's budget are returned.
+    """
+    try:
+        store = _get_store()
+        if store.count() == 0:
             return "No vector database found. Please add documents first using add_to_vectorstore."
 
-        # Query the collection - let ChromaDB handle embedding the query
-        results = collection.query(
-            query_texts=[query],
-            n_results=k
-        )
-
-        if not results['documents'] or not results['documents'][0]:
+        k = int(k) if k is not None else active_profile.retrieval_k
+        # Fetch extra candidates so merging and de-duplication still leave enough to fill the budget
+        with span("store.query", backend=VECTOR_STORE, k=k * RETRIEVAL_OVERFETCH):
+            hits = store.query(query, k * RETRIEVAL_OVERFETCH)
+        with span("retrieval.pack", hits=len(hits)):
+            if token_budget is not None:
+                spans = pack(hits, token_budget=int(token_budget))
+            else:
+                spans = pack(hits, token_budget=active_profile.retrieval_token_budget, max_spans=k)
+        if not spans:
             return "No similar content found"
 
-        formatted_results = []
-        documents = results['documents'][0]
-        metadatas = results['metadatas'][0]
-
-        for i in range(len(documents)):
-            source = metadatas[i].get("source", "Unknown")
-            chunk = metadatas[i].get("chunk", "")
-            formatted_results.append(f"Result {i+1} (from {source}, chunk {chunk}):\n{documents[i]}\n")
-
-        return "\n".join(formatted_results)
+        return format_spans(spans)
     except Exception as e:
+        record_error("search_vectorstore", e)
         return f"Error searching vectorstore: {e}"
 
 def index_codebase(directory_path: str = None) -> str:
     """Index all code files in a directory to the vector database."""
-    index_path = _resolve_path(directory_path) if directory_path is not None else current_dir
+    index_path = _resolve_path(directory_path) if directory_path is not None else get_current_dir()
     try:
         indexed_files = 0
-        code_extensions = {'.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', '.md', '.txt', '.json', '.yaml', '.yml'}
+        # Remembered first, so the files below need no entries of their own
+        _remember_indexed(index_path)
+        for file_path in _walk_indexable(index_path):
+            result = add_to_vectorstore(file_path)
+            if not result.startswith("Error"):
+                indexed_files += 1
 
-        for root, dirs, files in os.walk(index_path):
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['node_modules', '__pycache__', 'venv', 'env']]
+        get_symbol_index().save()
+        summary = f"Indexed {indexed_files} files from {index_path}"
+        if VECTOR_STORE == "compact":
+            summary += "\n" + compact_store_report(recall=COMPACT_RECALL_CHECK)
+        status = _get_store().status()
+        if status["building"]:
+            done, total = status["progress"]
+            summary += (f"\nRe-embedding into index version {status['building']} in the background "
+                        f"({done}/{total} files); queries use version {status['active']} until it is done")
+        return summary
+    except Exception as e:
+        record_error("index_codebase", e)
+        return f"Error indexing codebase: {e}"
 
-            for file in files:
-                if any(file.endswith(ext) for ext in code_extensions):
-                    file_path = os.path.join(root, file)
-                    result = add_to_vectorstore(file_path)
-                    if not result.startswith("Error"):
-                        indexed_files += 1
+def repo_map(path: Optional[str] = None, depth: int = 2) -> str:
+    """Return a ranked skeleton of the code under a path: files, classes and functions with line numbers."""
+    root = _resolve_path(path) if path is not None else get_current_dir()
+    if not os.path.isdir(root):
+        return f"Error: The path {root} is not a valid directory."
+    try:
+        index = get_symbol_index()
+        index.update_tree(root, is_indexable, skip_directory)
+        return index.repo_map(root, depth=int(depth))
+    except Exception as e:
+        return f"Error building repo map: {e}"
 
-        return f"Indexed {indexed_files} files from {index_path}"
+def find_symbol(name: str) -> str:
+    """Find where a class, function or method is defined and which files use it."""
+    try:
+        index = get_symbol_index()
+        index.update_tree(get_current_dir(), is_indexable, skip_directory)
+        return index.find_symbol(name, root=get_current_dir())
     except Exception as e:
-        return f"Error indexing codebase: {e}"
\ No newline at end of file
+        return f"Error finding symbol: {e}"
+
+def compact_store_report(recall: bool = False) -> str:
+    """Summarize memory use of the compact store and, with `recall`, its recall against exact float32 search."""
+    store = _get_store()
+    memory = store.memory_report()
+    report = (
+        f"Compact index: {memory['vectors']} vectors, "
+        f"{memory['code_bytes'] / 1e6:.1f} MB of codes vs {memory['float32_bytes'] / 1e6:.1f} MB float32 "
+        f"({memory['compression']:.1f}x smaller); "
+        f"{memory['resident_bytes'] / 1e6:.1f} MB in RAM with {memory['row_overhead_bytes'] / 1e6:.1f} MB "
+        f"of per-row ids and metadata ({memory['total_compression']:.1f}x overall)"
+    )
+    if recall:
+        result = store.recall_benchmark()
+        report += (f"; recall@{result['k']} {result['recall']:.3f} with re-ranking, "
+                   f"{result['recall_no_rerank']:.3f} coarse-only over {result['queries']} queries")
+    return report
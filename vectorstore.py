@@ -0,0 +1,503 @@
+"""Pluggable vector stores behind add_to_vectorstore / search_vectorstore.
+
+Backends share one small interface so they can be swapped with the
+VECTOR_STORE environment variable and A/B tested with tets_script.py:
+
+    chroma   ChromaDB persistent collection (default)
+    numpy    in-process index over memory-mapped float32 vectors; exact
+             BLAS search for small corpora, IVF for large ones
+    compact  numpy layout plus int8 codes in RAM (see compact_store.py)
+"""
+import json
+import os
+import threading
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+# Rows scored per BLAS call when scanning the whole matrix
+SCAN_BLOCK_ROWS = 65536
+# Switch from exact flat search to IVF above this many vectors
+IVF_MIN_ROWS = 50000
+# Rebuild the IVF centroids once the index has grown by this fraction
+IVF_REBUILD_GROWTH = 0.5
+IVF_TRAIN_SAMPLE = 50000
+IVF_ITERATIONS = 10
+# Rewrite the files without deleted rows once they make up this share of the store
+COMPACT_DEAD_FRACTION = 0.25
+COMPACT_MIN_ROWS = 256
+
+
+class VectorStore:
+    """Interface shared by every backend. Documents are embedded by the store."""
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[dict]):
+        """Add or replace documents; existing ids are overwritten."""
+        raise NotImplementedError
+
+    def delete(self, source: str, keep_ids: Optional[Iterable[str]] = None):
+        """Remove every chunk whose metadata `source` equals the given path, except `keep_ids`."""
+        raise NotImplementedError
+
+    def delete_ids(self, ids: List[str]):
+        """Remove the chunks with the given ids; unknown ids are ignored."""
+        raise NotImplementedError
+
+    def query(self, query: str, k: int = 5) -> List[dict]:
+        """Return up to k hits as dicts with id, score, document and metadata, best first."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def sources(self) -> set:
+        """Every `source` path that has chunks in the store."""
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """A ChromaDB collection that embeds documents with the given embedding function."""
+
+    def __init__(self, client, name: str, embedding_function):
+        self.client = client
+        self.name = name
+        self.embedding_function = embedding_function
+
+    def _collection(self, create: bool = False):
+        if create:
+            return self.client.get_or_create_collection(name=self.name, embedding_function=self.embedding_function)
+        try:
+            return self.client.get_collection(name=self.name, embedding_function=self.embedding_function)
+        except Exception:
+            return None  # Nothing added yet
+
+    def add(self, ids, documents, metadatas):
+        # Errors such as a dimension mismatch propagate; a model change gets a new
+        # collection through index_versions.py instead of wiping this one
+        self._collection(create=True).upsert(documents=documents, metadatas=metadatas, ids=ids)
+
+    def delete(self, source, keep_ids=None):
+        collection = self._collection()
+        if collection is None:
+            return
+        if keep_ids is None:
+            collection.delete(where={"source": source})
+            return
+        keep = set(keep_ids)
+        stale = [id_ for id_ in collection.get(where={"source": source}, include=[])["ids"] if id_ not in keep]
+        if stale:
+            collection.delete(ids=stale)
+
+    def delete_ids(self, ids):
+        collection = self._collection()
+        if collection is not None and ids:
+            collection.delete(ids=list(ids))
+
+    def query(self, query, k=5):
+        collection = self._collection()
+        if collection is None:
+            return []
+        results = collection.query(query_texts=[query], n_results=k)
+        if not results['documents'] or not results['documents'][0]:
+            return []
+        distances = (results.get('distances') or [[None] * len(results['ids'][0])])[0]
+        return [
+            {"id": id_, "score": None if distance is None else -distance, "document": document, "metadata": metadata}
+            for id_, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0], distances)
+        ]
+
+    def count(self):
+        collection = self._collection()
+        return collection.count() if collection is not None else 0
+
+    def sources(self):
+        collection = self._collection()
+        if collection is None:
+            return set()
+        return {meta.get("source") for meta in collection.get(include=["metadatas"])["metadatas"] if meta}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _kmeans(data: np.ndarray, n_clusters: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        # Re-seed empty clusters from random points
+        sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class NumpyVectorStore(VectorStore):
+    """Cosine-similarity index over memory-mapped float32 vectors.
+
+    Files under `path`:
+        config.json      vector dimension and backend settings
+        vectors.f32      normalized float32 vectors, row-major
+        documents.txt    chunk text, addressed by byte offset
+        records.jsonl    append-only log of ids, metadata and deletions
+        ivf_centroids.npy / ivf_assign.i32   IVF index, once the corpus is large
+
+    Opening the store only reads the record log; vectors are paged in by the OS on demand.
+    Once deleted rows pass COMPACT_DEAD_FRACTION the files are rewritten without them
+    (see compact()).
+    """
+
+    def __init__(self, path: str, embedding_function, nprobe: int = 16):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+
+        self.config = {"dim": None}
+        self.config.update(self._default_config())
+        if os.path.exists(self._file("config.json")):
+            # The layout of an existing store wins over the requested settings
+            with open(self._file("config.json")) as f:
+                self.config.update(json.load(f))
+        self._load()
+
+    def _default_config(self) -> dict:
+        return {}
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.config["dim"]
+
+    def _row_files(self) -> List[tuple]:
+        """(file name, bytes per row) of every file holding one fixed-size entry per row."""
+        files = [("vectors.f32", 4 * (self.dim or 0))]
+        if os.path.exists(self._file("ivf_assign.i32")):
+            files.append(("ivf_assign.i32", 4))
+        return files
+
+    def _load(self):
+        self._finish_compaction()
+        self.ids: List[str] = []
+        self.metadatas: List[dict] = []
+        self._doc_spans: List[tuple] = []
+        self._id_to_row = {}
+        self._vectors = None
+        alive = []
+
+        records_path = self._file("records.jsonl")
+        if os.path.exists(records_path):
+            complete, line = 0, b"\n"
+            with open(records_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        if f.read(1):
+                            raise  # Damage before the end of the log is not a torn append
+                        break
+                    complete += len(line)
+                    if "delete" in record:
+                        row = record["delete"]
+                        alive[row] = False
+                        self._id_to_row.pop(self.ids[row], None)
+                        continue
+                    self._id_to_row[record["id"]] = len(self.ids)
+                    self.ids.append(record["id"])
+                    self.metadatas.append(record["metadata"])
+                    self._doc_spans.append((record["offset"], record["length"]))
+                    alive.append(True)
+            # A crash mid-append leaves a partial last record; cut the log back to
+            # the last complete one so later appends start on a fresh line
+            if complete < os.path.getsize(records_path):
+                os.truncate(records_path, complete)
+            elif not line.endswith(b"\n"):
+                with open(records_path, "ab") as f:
+                    f.write(b"\n")
+        self._size = len(self.ids)
+        self._alive = np.array(alive, dtype=bool)
+        self._live = int(self._alive.sum())
+
+        # A crash between appending vectors and logging their records leaves extra rows
+        # at the end of the row files (codes too, in the compact store); later appends
+        # would be misaligned, so cut them off to the surviving records
+        for name, row_bytes in self._row_files():
+            if row_bytes and os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > self._size * row_bytes:
+                os.truncate(self._file(name), self._size * row_bytes)
+
+        self._centroids = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        if os.path.exists(self._file("ivf_centroids.npy")):
+            self._centroids = np.load(self._file("ivf_centroids.npy"))
+            self._assign = np.fromfile(self._file("ivf_assign.i32"), dtype=np.int32)[:self._size]
+            if len(self._assign) < self._size:
+                # The log got ahead of the IVF assignment file; rebuild on next add
+                self._centroids = None
+
+    def _vector_map(self) -> np.memmap:
+        if self._vectors is None or self._vectors.shape[0] < self._size:
+            self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                      shape=(self._size, self.dim))
+        return self._vectors
+
+    def _alive_mask(self) -> np.ndarray:
+        return self._alive[:self._size]
+
+    def count(self) -> int:
+        return self._live
+
+    def sources(self) -> set:
+        with self._lock:
+            return {self.metadatas[row].get("source") for row in np.flatnonzero(self._alive_mask())}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return _normalize(np.asarray(self.embedding_function(texts), dtype=np.float32))
+
+    def add(self, ids, documents, metadatas):
+        self.add_embeddings(ids, self.embed(documents), documents, metadatas)
+
+    def add_embeddings(self, ids: List[str], embeddings, documents: List[str], metadatas: List[dict]):
+        """Add or replace precomputed embeddings."""
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.config["dim"] = int(vectors.shape[1])
+                with open(self._file("config.json"), "w") as f:
+                    json.dump(self.config, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            self._delete_rows([self._id_to_row[i] for i in ids if i in self._id_to_row])
+            with open(self._file("vectors.f32"), "ab") as f:
+                vectors.tofile(f)
+            with open(self._file("documents.txt"), "ab") as docs, open(self._file("records.jsonl"), "a") as records:
+                offset = docs.tell()
+                for id_, document, metadata in zip(ids, documents, metadatas):
+                    data = document.encode("utf-8")
+                    docs.write(data)
+                    records.write(json.dumps({"id": id_, "metadata": metadata, "offset": offset, "length": len(data)}) + "\n")
+                    self._id_to_row[id_] = len(self.ids)
+                    self.ids.append(id_)
+                    self.metadatas.append(metadata)
+                    self._doc_spans.append((offset, len(data)))
+                    offset += len(data)
+
+            self._on_vectors_added(vectors)
+            needed = self._size + len(vectors)
+            if needed > len(self._alive):
+                # Grow geometrically, as the compact store does for its codes
+                grown = np.zeros(max(needed, 2 * len(self._alive), 1024), dtype=bool)
+                grown[:self._size] = self._alive[:self._size]
+                self._alive = grown
+            self._alive[self._size:needed] = True
+            self._live += len(vectors)
+            self._size = needed
+            self._update_ivf(vectors)
+            self._maybe_compact()
+
+    def _on_vectors_added(self, vectors: np.ndarray):
+        """Hook for subclasses that keep extra per-row data; called before the size grows."""
+
+    def _update_ivf(self, vectors: np.ndarray):
+        built_rows = self.config.get("ivf_rows", 0)
+        if self._centroids is None or self._size > built_rows * (1 + IVF_REBUILD_GROWTH):
+            if self.count() >= IVF_MIN_ROWS:
+                self.build_ivf()
+            elif self._centroids is not None:
+                # Too few live rows to retrain (e.g. after a compaction); the new rows
+                # would belong to no list, so go back to the exact scan
+                self._drop_ivf()
+            return
+        # Small additions go to the nearest existing list
+        assign = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+        with open(self._file("ivf_assign.i32"), "ab") as f:
+            assign.tofile(f)
+        self._assign = np.concatenate([self._assign, assign])
+
+    def _drop_ivf(self):
+        for name in ("ivf_centroids.npy", "ivf_assign.i32"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        self._centroids = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        if self.config.pop("ivf_rows", None) is not None:
+            with open(self._file("config.json"), "w") as f:
+                json.dump(self.config, f)
+
+    def build_ivf(self, seed: int = 0):
+        """Train IVF centroids on a sample of the vectors and assign every row to a list."""
+        with self._lock:
+            vectors = self._vector_map()
+            alive = np.flatnonzero(self._alive_mask())
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(alive, size=min(IVF_TRAIN_SAMPLE, len(alive)), replace=False))
+            n_lists = max(1, int(4 * np.sqrt(len(alive))))
+            centroids = _kmeans(np.asarray(vectors[sample]), min(n_lists, len(sample)), IVF_ITERATIONS, seed)
+
+            assign = np.empty(self._size, dtype=np.int32)
+            for start in range(0, self._size, SCAN_BLOCK_ROWS):
+                block = vectors[start:start + SCAN_BLOCK_ROWS]
+                assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            np.save(self._file("ivf_centroids.npy"), centroids)
+            assign.tofile(self._file("ivf_assign.i32"))
+            self._centroids, self._assign = centroids, assign
+            self.config["ivf_rows"] = self._size
+            with open(self._file("config.json"), "w") as f:
+                json.dump(self.config, f)
+
+    def _delete_rows(self, rows: List[int]):
+        if not rows:
+            return
+        with open(self._file("records.jsonl"), "a") as records:
+            for row in rows:
+                if self._alive[row]:
+                    self._alive[row] = False
+                    self._live -= 1
+                    self._id_to_row.pop(self.ids[row], None)
+                    records.write(json.dumps({"delete": row}) + "\n")
+
+    def delete(self, source, keep_ids=None):
+        keep = set(keep_ids or ())
+        with self._lock:
+            self._delete_rows([row for row, meta in enumerate(self.metadatas)
+                               if self._alive[row] and meta.get("source") == source and self.ids[row] not in keep])
+            self._maybe_compact()
+
+    def delete_ids(self, ids):
+        with self._lock:
+            self._delete_rows([self._id_to_row[i] for i in ids if i in self._id_to_row])
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self._size - self._live
+        if self._size >= COMPACT_MIN_ROWS and dead > COMPACT_DEAD_FRACTION * self._size:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the store without deleted rows.
+
+        The new files are written next to the old ones as *.new, then a
+        compact.commit marker is written and the files are renamed over the old
+        ones. If the process dies before the marker exists the *.new files are
+        discarded on the next open; after it, the renames are finished then.
+        """
+        with self._lock:
+            keep = np.flatnonzero(self._alive_mask())
+            if self._centroids is None:
+                # Assignments that lag behind the log cannot be remapped; they are rebuilt on a later add
+                self._drop_ivf()
+            for name, row_bytes in self._row_files():
+                if not row_bytes:
+                    continue
+                rows = np.memmap(self._file(name), dtype=np.uint8, mode="r", shape=(self._size, row_bytes))
+                with open(self._file(name + ".new"), "wb") as f:
+                    for start in range(0, len(keep), SCAN_BLOCK_ROWS):
+                        rows[keep[start:start + SCAN_BLOCK_ROWS]].tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                del rows
+            with open(self._file("documents.txt"), "rb") as old_docs, \
+                    open(self._file("documents.txt.new"), "wb") as docs, \
+                    open(self._file("records.jsonl.new"), "w") as records:
+                offset = 0
+                for row in keep:
+                    start, length = self._doc_spans[row]
+                    old_docs.seek(start)
+                    docs.write(old_docs.read(length))
+                    records.write(json.dumps({"id": self.ids[row], "metadata": self.metadatas[row],
+                                              "offset": offset, "length": length}) + "\n")
+                    offset += length
+                for f in (docs, records):
+                    f.flush()
+                    os.fsync(f.fileno())
+            if self._centroids is not None:
+                self.config["ivf_rows"] = len(keep)
+                with open(self._file("config.json"), "w") as f:
+                    json.dump(self.config, f)
+            with open(self._file("compact.commit"), "w") as f:
+                json.dump([name for name, _ in self._row_files()] + ["documents.txt", "records.jsonl"], f)
+                f.flush()
+                os.fsync(f.fileno())
+            self._vectors = None
+            self._load()
+
+    def _finish_compaction(self):
+        """Complete or discard a compaction interrupted by a crash."""
+        marker = self._file("compact.commit")
+        if os.path.exists(marker):
+            with open(marker) as f:
+                names = json.load(f)
+            for name in names:
+                if os.path.exists(self._file(name + ".new")):
+                    os.replace(self._file(name + ".new"), self._file(name))
+            os.remove(marker)
+        for name in os.listdir(self.path):
+            if name.endswith(".new"):
+                os.remove(self._file(name))
+
+    def _read_document(self, row: int) -> str:
+        offset, length = self._doc_spans[row]
+        with open(self._file("documents.txt"), "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows in the nprobe closest IVF lists, or None to scan everything."""
+        if self._centroids is None:
+            return None
+        probe = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        return np.flatnonzero(np.isin(self._assign[:self._size], probe))
+
+    def _search_rows(self, query: np.ndarray, k: int) -> List[tuple]:
+        alive = self._alive_mask()
+        if not alive.any():
+            return []
+        vectors = self._vector_map()
+        candidates = self._candidate_rows(query)
+        if candidates is None:
+            scores = np.empty(self._size, dtype=np.float32)
+            for start in range(0, self._size, SCAN_BLOCK_ROWS):
+                scores[start:start + SCAN_BLOCK_ROWS] = vectors[start:start + SCAN_BLOCK_ROWS] @ query
+            candidates = np.flatnonzero(alive)
+            scores = scores[candidates]
+        else:
+            candidates = candidates[alive[candidates]]
+            scores = vectors[candidates] @ query
+        k = min(k, len(candidates))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def query(self, query, k=5):
+        vector = self.embed([query])[0]
+        with self._lock:
+            return [
+                {"id": self.ids[row], "score": score,
+                 "document": self._read_document(row), "metadata": self.metadatas[row]}
+                for row, score in self._search_rows(vector, int(k))
+            ]
+
+
+def open_store(backend: str, embedding_function, chroma_client=None, path: Optional[str] = None,
+               collection_name: str = "codebase", **options) -> VectorStore:
+    """Create the named backend."""
+    if backend == "chroma":
+        return ChromaVectorStore(chroma_client, collection_name, embedding_function)
+    if backend == "numpy":
+        return NumpyVectorStore(path, embedding_function, **options)
+    if backend == "compact":
+        from compact_store import CompactVectorStore
+        return CompactVectorStore(path, embedding_function, **options)
+    raise ValueError(f"Unknown vector store backend: {backend}")
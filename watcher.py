@@ -0,0 +1,262 @@
+"""Background watcher that keeps the vector index in sync with the files on disk.
+
+Changes under the watched directories are picked up with inotify on Linux,
+or by periodically comparing mtimes elsewhere. Bursts of events (an editor
+save, `git checkout`, a build) are debounced per path, and the settled paths
+are re-embedded by a worker thread. The chat loop never blocks on it. Only
+files that are already covered by the index (see tools.is_indexed) are
+re-embedded.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+import tools
+from telemetry import record_error
+
+# Seconds a path must stay quiet before it is re-embedded
+DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "1.0"))
+POLL_INTERVAL_SECONDS = float(os.getenv("WATCH_POLL_INTERVAL_SECONDS", "2.0"))
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """Recursive directory watching through the Linux inotify API."""
+
+    def __init__(self, on_change, stop: threading.Event):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._on_change = on_change
+        self._stop = stop
+        self._dirs = {}  # watch descriptor -> directory
+        # add_tree runs on its own threads while run() handles events
+        self._dirs_lock = threading.Lock()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+
+    def add_tree(self, root: str):
+        for directory, dirs, _ in os.walk(root):
+            dirs[:] = [d for d in dirs if not tools.skip_directory(d)]
+            wd = self._add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                with self._dirs_lock:
+                    self._dirs[wd] = directory
+                continue
+            # Typically ENOSPC once fs.inotify.max_user_watches is used up
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                continue  # Removed while walking
+            print(f"[watcher] Cannot watch {directory} with inotify ({os.strerror(error)}); polling it instead")
+            self._poll(directory)
+            dirs[:] = []  # The polling backend covers the whole subtree
+
+    def _poll(self, root: str):
+        with self._fallback_lock:
+            if self._fallback is None:
+                self._fallback = PollingBackend(self._on_change)
+                threading.Thread(target=self._fallback.run, args=(self._stop,), daemon=True).start()
+        self._fallback.add_tree(root)
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 0.5)
+            if not ready:
+                continue
+            data = os.read(self._fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                try:
+                    self._handle(wd, mask, os.fsdecode(name))
+                except Exception as e:
+                    # One bad event must not end live indexing
+                    record_error("watcher", e)
+                    print(f"[watcher] Error handling an event for {name!r}: {e}")
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped; rescan every watched tree
+            with self._dirs_lock:
+                directories = set(self._dirs.values())
+            for directory in directories:
+                self._on_change(directory)
+            return
+        with self._dirs_lock:
+            directory = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                return
+        if directory is None:
+            return
+        path = os.path.join(directory, name) if name else directory
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and not tools.skip_directory(name):
+                self.add_tree(path)
+            elif mask & IN_MOVED_FROM:
+                # inotify keeps following the moved directory, which would report events under the old path
+                with self._dirs_lock:
+                    for watched, watched_dir in list(self._dirs.items()):
+                        if watched_dir == path or watched_dir.startswith(path + os.sep):
+                            self._rm_watch(self._fd, watched)
+                            self._dirs.pop(watched, None)
+            # Files in a moved or new directory never produced their own events
+            self._on_change(path)
+        else:
+            self._on_change(path)
+
+
+class PollingBackend:
+    """Portable fallback that diffs file mtimes every few seconds."""
+
+    def __init__(self, on_change):
+        self._on_change = on_change
+        self._roots = set()
+        self._snapshot = {}
+        self._lock = threading.Lock()
+
+    def _scan(self, root: str) -> dict:
+        mtimes = {}
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not tools.skip_directory(d)]
+            for file in files:
+                path = os.path.join(directory, file)
+                try:
+                    mtimes[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+        return mtimes
+
+    def add_tree(self, root: str):
+        snapshot = self._scan(root)
+        with self._lock:
+            self._roots.add(root)
+            self._snapshot.update(snapshot)
+
+    def run(self, stop: threading.Event):
+        while not stop.wait(POLL_INTERVAL_SECONDS):
+            with self._lock:
+                roots = list(self._roots)
+            current = {}
+            for root in roots:
+                current.update(self._scan(root))
+            with self._lock:
+                previous, self._snapshot = self._snapshot, current
+            for path in set(previous) | set(current):
+                if previous.get(path) != current.get(path):
+                    self._on_change(path)
+
+
+class IndexWatcher:
+    """Watches directory trees and re-embeds changed files off the request path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roots = set()
+        self._pending = {}  # path -> time of the last event
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._backend = None
+        self.reindexed = 0
+
+    def _start(self):
+        try:
+            if not sys.platform.startswith("linux"):
+                raise OSError("inotify is only available on Linux")
+            self._backend = InotifyBackend(self._on_change, self._stop)
+        except (OSError, AttributeError):
+            self._backend = PollingBackend(self._on_change)
+        for target in (self._backend.run, self._debounce_loop, self._reindex_loop):
+            threading.Thread(target=target, args=(self._stop,), daemon=True).start()
+
+    def watch(self, root: str):
+        """Start watching a directory tree (no-op if it is already covered)."""
+        root = os.path.abspath(root)
+        with self._lock:
+            if any(root == r or root.startswith(r + os.sep) for r in self._roots):
+                return
+            if self._backend is None:
+                self._start()
+            self._roots.add(root)
+        # Walking a large tree takes a while; don't hold up the caller
+        threading.Thread(target=self._backend.add_tree, args=(root,), daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _on_change(self, path: str):
+        with self._lock:
+            self._pending[path] = time.monotonic()
+
+    def _debounce_loop(self, stop: threading.Event):
+        while not stop.wait(DEBOUNCE_SECONDS / 4):
+            now = time.monotonic()
+            with self._lock:
+                settled = [p for p, t in self._pending.items() if now - t >= DEBOUNCE_SECONDS]
+                for path in settled:
+                    del self._pending[path]
+            for path in settled:
+                self._queue.put(path)
+
+    def _reindex_loop(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                path = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._reindex(path)
+            except Exception as e:
+                print(f"[watcher] Error re-indexing {path}: {e}")
+
+    def _reindex(self, path: str):
+        if os.path.isdir(path):
+            # A directory appeared or was moved in; queue its files
+            for directory, dirs, files in os.walk(path):
+                dirs[:] = [d for d in dirs if not tools.skip_directory(d)]
+                for file in files:
+                    self._queue.put(os.path.join(directory, file))
+            return
+        if not os.path.exists(path) and not tools.is_indexable(path):
+            # Possibly a directory that was deleted or moved out of the tree; its
+            # files produced no events of their own
+            if tools.has_indexed_under(path):
+                tools.remove_tree_from_vectorstore(path)
+                self.reindexed += 1
+            return
+        if not tools.is_indexable(path) or not tools.is_indexed(path):
+            return
+        if os.path.exists(path):
+            tools.add_to_vectorstore(path)
+        else:
+            tools.remove_from_vectorstore(path)
+        self.reindexed += 1
+
+
+# Process-wide watcher shared by every session
+shared_watcher = IndexWatcher()